@@ -0,0 +1,2 @@
+# BGG のコレクション / プレイ記録を取得して bgg_collection.json などに書き出す。
+# 使い方は `python -m bggfetch --help`。
@@ -0,0 +1,253 @@
+import time
+import xml.etree.ElementTree as ET
+
+from . import config
+from .thing import parse_thing
+from .xmlutil import xml_to_dict
+
+# ★ APIカウンタ
+COLLECTION_CALLS = 0
+PLAYS_CALLS = 0
+
+# daemon では全フェーズで1つの RateBudget を共有する（None なら従来どおり各所の sleep だけ）
+RATE_BUDGET = None
+_SESSION = None
+
+# 同じ objectid が複数の entry で返ったときに残す status（先にあるものを優先）
+STATUS_PRIORITY = ["owned", "preordered", "wishlist", "previouslyowned", "played(not owned)"]
+
+
+def _get(url, **kwargs):
+    # 接続は Session で使い回す（daemon では実行をまたいで keep-alive のまま）
+    import requests
+
+    global _SESSION
+    if _SESSION is None:
+        _SESSION = requests.Session()
+    if RATE_BUDGET is not None:
+        RATE_BUDGET.acquire()
+    resp = _SESSION.get(url, timeout=60, **kwargs)
+    if resp.status_code == 429 and RATE_BUDGET is not None:
+        retry_after = resp.headers.get("Retry-After")
+        RATE_BUDGET.penalize(int(retry_after) if retry_after and retry_after.isdigit() else config.SLEEP_ON_429)
+    return resp
+
+
+# ====================================
+# plays（boardgame + boardgameexpansion 対応）
+# ====================================
+def fetch_plays(username, full_refresh=False):
+    # 戻り値: [{"id", "date", "objectid", "quantity", "name"}]
+    # full_refresh でなければ subtype ごとに最新の1ページだけ
+    # （boardgame と boardgameexpansion の両方で返る記録は play id でまとめる）
+    global PLAYS_CALLS
+    headers = config.auth_headers()
+    records = {}
+
+    for subtype in ["boardgame", "boardgameexpansion"]:
+        page = 1
+        while True:
+            url = f"{config.API_ROOT}/plays?username={username}&subtype={subtype}&page={page}"
+            resp = _get(url, headers=headers)
+            PLAYS_CALLS += 1
+
+            if resp.status_code == 202:
+                time.sleep(5)
+                continue
+
+            resp.raise_for_status()
+            root = ET.fromstring(resp.content)
+            plays = root.findall("play")
+
+            if not plays:
+                break
+
+            for play in plays:
+                date = play.get("date")
+                item = play.find("item")
+                if item is None:
+                    continue
+                game_id = item.get("objectid")
+                if game_id and date:
+                    pid = play.get("id") or f"{game_id}:{date}"
+                    quantity = play.get("quantity") or "1"
+                    records[pid] = {
+                        "id": pid,
+                        "date": date,
+                        "objectid": game_id,
+                        "quantity": int(quantity) if quantity.isdigit() else 1,
+                        "name": item.get("name") or "",
+                    }
+
+            if not full_refresh:
+                break
+
+            page += 1
+            time.sleep(1)
+
+    return list(records.values())
+
+
+def latest_plays(records):
+    # objectid → 最終プレイ日
+    lastplays = {}
+    for r in records:
+        if r["objectid"] not in lastplays or r["date"] > lastplays[r["objectid"]]:
+            lastplays[r["objectid"]] = r["date"]
+    return lastplays
+
+
+def fetch_latest_plays(username, full_refresh=False):
+    return latest_plays(fetch_plays(username, full_refresh))
+
+
+# ====================================
+# collection（subtype ごとに並列取得）
+# ====================================
+def fetch_collection_all(username, modifiedsince=None, ids=None, subtype=None):
+    # 202 の間は間隔を倍にしながらポーリングする（最大 COLLECTION_MAX_WAIT 秒）
+    # modifiedsince: YYYY-MM-DD。その日以降に変更されたアイテムだけを取る
+    # ids: objectid のリスト。そのアイテムだけを取る
+    # subtype: boardgame / boardgameexpansion など
+    global COLLECTION_CALLS
+    url = f"{config.API_ROOT}/collection?username={username}&stats=1"
+    if subtype:
+        url += f"&subtype={subtype}"
+        if subtype == "boardgame":
+            # subtype=boardgame だけだと拡張も subtype="boardgame" として返ってくる
+            url += "&excludesubtype=boardgameexpansion"
+    if modifiedsince:
+        url += f"&modifiedsince={modifiedsince}"
+    if ids:
+        url += f"&id={','.join(ids)}"
+    headers = config.auth_headers()
+    started = time.monotonic()
+    delay = config.COLLECTION_POLL_INITIAL
+
+    while True:
+        resp = _get(url, headers=headers)
+        COLLECTION_CALLS += 1
+
+        if resp.status_code == 202 or not resp.text.strip():
+            if time.monotonic() - started + delay > config.COLLECTION_MAX_WAIT:
+                raise Exception("Collection fetch timeout")
+            time.sleep(delay)
+            delay = min(delay * 2, config.COLLECTION_POLL_MAX)
+            continue
+        resp.raise_for_status()
+        root = ET.fromstring(resp.content)
+        break
+
+    games = []
+
+    for item in root.findall("item"):
+        g = xml_to_dict(item)
+
+        status_node = item.find("status")
+        if status_node is not None:
+            if status_node.get("own") == "1":
+                g["status"] = "owned"
+            elif status_node.get("wishlist") == "1":
+                g["status"] = "wishlist"
+            elif status_node.get("preordered") == "1":
+                g["status"] = "preordered"
+            elif status_node.get("prevowned") == "1":
+                g["status"] = "previouslyowned"
+            else:
+                g["status"] = "played(not owned)"
+
+        if subtype:
+            g["subtype"] = subtype
+        games.append(g)
+
+    return games
+
+
+def merge_subtypes(results):
+    # subtype ごとの取得結果を objectid で1つにまとめる
+    # 同じ objectid が複数あれば status の優先度が高い entry を残し、
+    # どれかで拡張として返っていれば subtype は boardgameexpansion にする
+    rank = {s: i for i, s in enumerate(STATUS_PRIORITY)}
+    merged = {}
+    for games in results:
+        for g in games:
+            oid = g["objectid"]
+            prev = merged.get(oid)
+            if prev is None:
+                merged[oid] = g
+                continue
+            keep, other = prev, g
+            if rank.get(g.get("status"), len(rank)) < rank.get(prev.get("status"), len(rank)):
+                keep, other = g, prev
+            if "boardgameexpansion" in (keep.get("subtype"), other.get("subtype")):
+                keep["subtype"] = "boardgameexpansion"
+            merged[oid] = keep
+    return list(merged.values())
+
+
+def fetch_collection(username, modifiedsince=None, ids=None):
+    # COLLECTION_SUBTYPES を並列に取得する（202 の待ちを重ねる）
+    from concurrent.futures import ThreadPoolExecutor
+
+    subtypes = config.COLLECTION_SUBTYPES
+    with ThreadPoolExecutor(max_workers=len(subtypes), thread_name_prefix="collection") as executor:
+        futures = [
+            executor.submit(fetch_collection_all, username, modifiedsince, ids, subtype) for subtype in subtypes
+        ]
+        return merge_subtypes([f.result() for f in futures])
+
+
+def start_collections(usernames, **params):
+    # 各ユーザーの collection 取得をバックグラウンドで始める（最初のリクエストで
+    # BGG 側のエクスポート作成が始まる）。戻り値は username → Future
+    # params は fetch_collection にそのまま渡す
+    from concurrent.futures import ThreadPoolExecutor
+
+    executor = ThreadPoolExecutor(max_workers=len(usernames), thread_name_prefix="collection")
+    futures = {u: executor.submit(fetch_collection, u, **params) for u in usernames}
+    executor.shutdown(wait=False)
+    return futures
+
+
+# ====================================
+# thing
+# ====================================
+def fetch_thing_info(game_id, policy=None, full=False):
+    # 戻り値は THING_KEYS をキーにした dict
+    # full=True なら bggfetch.thing.parse_thing で取り出せる項目すべて
+    # 429 / 202 / 通信エラーは policy（RetryPolicy）の上限までリトライする
+    import requests
+
+    from .retry import RetryPolicy
+
+    policy = policy or RetryPolicy()
+    headers = config.auth_headers()
+    params = {"id": game_id, "stats": 1}
+
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            resp = _get(config.API_THING, params=params, headers=headers)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            policy.wait(attempt, type(e).__name__)
+            continue
+        if resp.status_code == 429:
+            retry_after = resp.headers.get("Retry-After")
+            delay = int(retry_after) if retry_after and retry_after.isdigit() else None
+            if RATE_BUDGET is not None:
+                # _get が RateBudget を止めているので、待つのは次の acquire だけにする
+                delay = 0
+            policy.wait(attempt, 429, delay)
+            continue
+        if resp.status_code == 202:
+            policy.wait(attempt, 202)
+            continue
+        resp.raise_for_status()
+        break
+
+    root = ET.fromstring(resp.text)
+    info = parse_thing(root.find("item"))
+    if full:
+        return info
+    return {k: info[k] for k in config.THING_KEYS}
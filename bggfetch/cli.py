@@ -0,0 +1,246 @@
+import argparse
+import datetime
+import json
+import sys
+
+from . import config
+
+
+# ====================================
+# サブコマンド
+# ====================================
+def _print_json(data, out=None):
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def cmd_run(args):
+    import functools
+
+    from .runner import run
+
+    run_fn = functools.partial(run, seed=args.seed) if args.seed else run
+    if args.no_lock:
+        result = run_fn(args.username, args.date, only=args.only, ids=args.ids)
+    else:
+        from .coalesce import single_flight
+
+        result = single_flight(run_fn, args.username, args.date, only=args.only, ids=args.ids)
+    # 取得に失敗したフェーズがあれば（書き出しは済ませたうえで）終了コード 1
+    return 1 if result and result["errors"] else 0
+
+
+def cmd_collection(args):
+    from . import api
+
+    _print_json(api.fetch_collection(args.username, modifiedsince=args.since), args.out)
+
+
+def cmd_plays(args):
+    from . import api
+
+    _print_json(api.fetch_latest_plays(args.username, full_refresh=args.full), args.out)
+
+
+def cmd_thing(args):
+    from . import api
+
+    _print_json({oid: api.fetch_thing_info(oid, full=args.full) for oid in args.ids}, args.out)
+
+
+def cmd_plan(args):
+    # 保存済みの bgg_collection.json から、今日の Thing 取得対象を表示する（API は呼ばない）
+    from .runner import print_seeded, read_export, today_jst
+    from .schedule import plan_targets
+    from .seed import SeedDump, seed_games
+    from .snapshot import Snapshot
+
+    data = read_export()
+    snapshot = Snapshot.open(config.SNAPSHOT_PATH, data)
+    schedule = snapshot.schedule() if snapshot else {}
+    games = {g["objectid"]: g for g in json.loads(data)}
+    if args.seed:
+        print_seeded(seed_games(games, [SeedDump(path) for path in args.seed], schedule))
+    to_update, target_info = plan_targets(games.values(), args.date or today_jst(), schedule)
+    print(f"Thing targets: {len(to_update)}")
+    for line in target_info:
+        print(line)
+
+
+def cmd_export(args):
+    # API を呼ばずに保存済みのデータから派生ファイルを作り直す
+    from .plays import write_plays_stats
+    from .runner import export_all, load_state, print_export_summary, read_export
+
+    state = load_state()
+    result = export_all(json.loads(read_export()), state)
+    # bgg_plays.json は保存済みのプレイ記録から作り直す
+    result["output_sizes"][config.PLAYS_STATS_PATH], _ = write_plays_stats(
+        config.PLAYS_STATS_PATH, config.PLAYS_STATE_PATH, None, False
+    )
+    print_export_summary(result)
+
+
+def cmd_query(args):
+    # 保存済みの bgg_collection.json を条件で絞り込む（API は呼ばない）
+    from . import query as q
+    from .runner import today_jst
+
+    since = None
+    if args.not_played_days is not None:
+        since = ((args.date or today_jst()) - datetime.timedelta(days=args.not_played_days)).isoformat()
+    criteria = {
+        "status": args.status, "type": args.type,
+        "mechanics": args.mechanic, "categories": args.category, "designers": args.designer,
+        "min_weight": args.min_weight, "max_weight": args.max_weight,
+        "players": args.players, "max_time": args.max_time, "not_played_since": since,
+    }
+
+    games = q.CollectionQuery.load(config.OUTPUT_PATH).select(q.build_filter(criteria))
+    if args.json:
+        _print_json(games)
+        return
+    for g in games:
+        print(f"{g['name']['value']} ({g['objectid']}) {g.get('status', '')} weight={g.get('weight')} lastplay={g.get('lastplay', '-')}")
+    print(f"{len(games)} match(es)")
+
+
+def cmd_search(args):
+    # ゲーム名のあいまい検索（出力時に作った n-gram インデックスを使う）
+    from .search import NameIndex, build_names_index
+
+    try:
+        index = NameIndex.load(config.NAMES_INDEX_PATH)
+    except FileNotFoundError:
+        from .runner import read_export
+
+        index = NameIndex(build_names_index(json.loads(read_export())))
+    results = index.search(" ".join(args.text), args.limit)
+    if args.json:
+        _print_json([{"score": round(score, 3), "objectid": oid, "name": name} for score, oid, name in results])
+        return
+    for score, oid, name in results:
+        print(f"{score:.3f} {name} ({oid})")
+
+
+def cmd_daemon(args):
+    from .daemon import run_daemon
+
+    run_daemon(args.username)
+
+
+def cmd_serve(args):
+    from .server import serve
+
+    serve(args.host, args.port)
+
+
+# ====================================
+# main
+# ====================================
+def phase_list(text):
+    from .runner import PHASES
+
+    phases = [p.strip() for p in text.split(",") if p.strip()]
+    for p in phases:
+        if p not in PHASES:
+            raise argparse.ArgumentTypeError(f"unknown phase: {p} (choose from {', '.join(PHASES)})")
+    return phases
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="bggfetch", description="BGG collection fetcher")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def date_arg(p):
+        p.add_argument("--date", type=datetime.date.fromisoformat, help="基準日 YYYY-MM-DD（既定: JSTの今日）")
+
+    def seed_arg(p):
+        p.add_argument(
+            "--seed", action="append", metavar="PATH",
+            help="Thing 情報を先に埋めるダンプ（ランキング CSV / bgg_collection.json）。複数指定可（先のものが優先）",
+        )
+
+    p = sub.add_parser("run", help="collection / thing / plays を取得して書き出す")
+    p.add_argument("--username", default=config.USERNAME)
+    date_arg(p)
+    p.add_argument("--only", type=phase_list, help="実行するフェーズ（例: plays, thing, collection,plays）")
+    p.add_argument("--ids", nargs="+", help="--only thing で取得する objectid（既定: 今日の取得対象）")
+    p.add_argument("--no-lock", action="store_true", help="実行中の run があっても待ち合わせない")
+    seed_arg(p)
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("collection", help="collection を取得して JSON で表示")
+    p.add_argument("--username", default=config.USERNAME)
+    p.add_argument("--since", help="この日（YYYY-MM-DD）以降に変更されたアイテムだけ取得する")
+    p.add_argument("--out")
+    p.set_defaults(func=cmd_collection)
+
+    p = sub.add_parser("plays", help="ゲームごとの最終プレイ日を取得して JSON で表示")
+    p.add_argument("--username", default=config.USERNAME)
+    p.add_argument("--full", action="store_true", help="全ページを取得する")
+    p.add_argument("--out")
+    p.set_defaults(func=cmd_plays)
+
+    p = sub.add_parser("thing", help="Thing 情報を取得して JSON で表示")
+    p.add_argument("ids", nargs="+")
+    p.add_argument("--full", action="store_true", help="THING_KEYS 以外の項目（ポールの集計など）も表示する")
+    p.add_argument("--out")
+    p.set_defaults(func=cmd_thing)
+
+    p = sub.add_parser("plan", help="Thing の取得対象を表示（API は呼ばない）")
+    date_arg(p)
+    seed_arg(p)
+    p.set_defaults(func=cmd_plan)
+
+    p = sub.add_parser("query", help="保存済みのコレクションを条件で絞り込む（API は呼ばない）")
+    date_arg(p)
+    p.add_argument("--status", nargs="+", help="owned / wishlist など（どれか）")
+    p.add_argument("--type", nargs="+", help="boardgame / boardgameexpansion（どれか）")
+    p.add_argument("--mechanic", action="append", help="メカニクス（複数指定はすべて満たすもの）")
+    p.add_argument("--category", action="append", help="カテゴリー（複数指定はすべて満たすもの）")
+    p.add_argument("--designer", action="append", help="デザイナー（複数指定はすべて満たすもの）")
+    p.add_argument("--min-weight", type=float)
+    p.add_argument("--max-weight", type=float)
+    p.add_argument("--players", type=float, help="この人数で遊べるもの")
+    p.add_argument("--max-time", type=float, help="プレイ時間（分）の上限")
+    p.add_argument("--not-played-days", type=int, help="この日数遊んでいないもの（未プレイを含む）")
+    p.add_argument("--json", action="store_true", help="アイテムを JSON で表示する")
+    p.set_defaults(func=cmd_query)
+
+    p = sub.add_parser("search", help="ゲーム名（別名を含む）のあいまい検索")
+    p.add_argument("text", nargs="+")
+    p.add_argument("--limit", type=int, default=10)
+    p.add_argument("--json", action="store_true")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("daemon", help="常駐して collection / plays / thing を定期的に取得する")
+    p.add_argument("--username", default=config.USERNAME)
+    p.set_defaults(func=cmd_daemon)
+
+    p = sub.add_parser("serve", help="保存済みのコレクションを HTTP で返す（読み取り専用）")
+    p.add_argument("--host", default=config.SERVE_HOST)
+    p.add_argument("--port", type=int, default=config.SERVE_PORT)
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("export", help="保存済みデータから出力ファイルを作り直す")
+    p.set_defaults(func=cmd_export)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    # thing サブコマンドの ids（位置引数）は対象外
+    if args.func is cmd_run and args.ids and (not args.only or "thing" not in args.only):
+        parser.error("--ids requires --only thing")
+    try:
+        return args.func(args) or 0
+    except RuntimeError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
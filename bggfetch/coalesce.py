@@ -0,0 +1,214 @@
+import contextlib
+import fcntl
+import json
+import os
+import socket
+import time
+
+from . import config
+
+# ====================================
+# 単一実行（single-flight）と依頼のまとめ
+# ====================================
+# 実行中に来た run の依頼はキューに積んで終了し、実行中のプロセスが
+# 終わったあとにまとめて1回だけ追加実行する。
+# 実行中の run がその依頼より後に始めたフェーズは、結果をそのまま使えるので追加実行しない。
+
+
+@contextlib.contextmanager
+def _guard():
+    # ロックの取得・解放とキューの読み書きをまとめて排他する
+    os.makedirs(config.STATE_DIR, exist_ok=True)
+    with open(config.QUEUE_PATH + ".guard", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _lock_is_stale():
+    try:
+        with open(config.LOCK_PATH, "r", encoding="utf-8") as f:
+            info = json.load(f)
+    except FileNotFoundError:
+        return True
+    except ValueError:
+        # 書きかけ等で読めないときはファイルの古さで判断する
+        return time.time() - os.path.getmtime(config.LOCK_PATH) > config.LOCK_STALE_SECONDS
+
+    # daemon は heartbeat で生存を知らせる
+    if time.time() - info.get("heartbeat", info.get("started", 0)) > config.LOCK_STALE_SECONDS:
+        return True
+    if info.get("host") == socket.gethostname():
+        try:
+            os.kill(info["pid"], 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+    return False
+
+
+def _acquire():
+    for _ in range(2):
+        try:
+            fd = os.open(config.LOCK_PATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if _lock_is_stale():
+                print("Removing stale run lock")
+                os.remove(config.LOCK_PATH)
+                continue
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"pid": os.getpid(), "host": socket.gethostname(), "started": time.time()}, f)
+        return True
+    return False
+
+
+def _heartbeat():
+    with open(config.LOCK_PATH, "r", encoding="utf-8") as f:
+        info = json.load(f)
+    info["heartbeat"] = time.time()
+    tmp_path = config.LOCK_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    os.replace(tmp_path, config.LOCK_PATH)
+
+
+def _read_queue():
+    try:
+        with open(config.QUEUE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return []
+
+
+def _write_queue(queue):
+    if not queue:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(config.QUEUE_PATH)
+        return
+    with open(config.QUEUE_PATH, "w", encoding="utf-8") as f:
+        json.dump(queue, f)
+
+
+# ------------------------------------
+# 依頼の整理
+# ------------------------------------
+def remaining(request, result):
+    # 完了した run の結果で足りない部分だけを残す（全部足りていれば None）
+    # result["phase_started"]: フェーズごとの取得開始時刻, result["thing_ids"]: Thing を取得した objectid
+    from .runner import PHASES
+
+    phases = request["only"] or PHASES
+    ids = request["ids"]
+    left = []
+    for phase in phases:
+        started = result["phase_started"].get(phase)
+        if started is None or started < request["at"]:
+            left.append(phase)
+        elif phase == "thing" and ids:
+            ids = [oid for oid in ids if oid not in result["thing_ids"]]
+            if ids:
+                left.append(phase)
+    if not left:
+        return None
+    return {"only": left, "ids": ids if "thing" in left else None, "at": request["at"]}
+
+
+def merge(requests):
+    # 複数の依頼を1回分の (only, ids) にまとめる
+    from .runner import PHASES
+
+    phases = set()
+    ids = set()
+    default_thing = False
+    for req in requests:
+        phases.update(req["only"])
+        if "thing" in req["only"]:
+            if req["ids"]:
+                ids.update(req["ids"])
+            else:
+                default_thing = True
+    only = [p for p in PHASES if p in phases]
+    if only == PHASES and default_thing:
+        return None, None
+    return only, (sorted(ids) if ids and not default_thing else None)
+
+
+# ====================================
+# 実行
+# ====================================
+def single_flight(run_fn, username, today=None, only=None, ids=None):
+    request = {"only": only, "ids": ids, "at": time.time()}
+
+    with _guard():
+        if not _acquire():
+            queue = _read_queue()
+            queue.append(request)
+            _write_queue(queue)
+            print(f"Another run is in progress; request queued ({len(queue)} pending)")
+            return None
+
+    try:
+        result = run_fn(username, today, only=only, ids=ids)
+        while True:
+            with _guard():
+                pending = [r for r in (remaining(req, result) for req in _read_queue()) if r]
+                _write_queue([])
+                if not pending:
+                    # キューが空なのを確認したまま解放する（取りこぼし防止）
+                    os.remove(config.LOCK_PATH)
+                    return result
+            only, ids = merge(pending)
+            print(f"Follow-up run for {len(pending)} queued request(s)")
+            result = run_fn(username, today, only=only, ids=ids)
+    except BaseException:
+        with _guard(), contextlib.suppress(FileNotFoundError):
+            os.remove(config.LOCK_PATH)
+        raise
+
+
+# ====================================
+# 常駐（daemon）用
+# ====================================
+# daemon は起動中ずっとロックを持つので、その間の run の依頼はすべてキューに入る。
+
+
+@contextlib.contextmanager
+def hold_lock():
+    with _guard():
+        if not _acquire():
+            raise RuntimeError("another run or daemon is in progress")
+    try:
+        yield
+    finally:
+        with _guard(), contextlib.suppress(FileNotFoundError):
+            os.remove(config.LOCK_PATH)
+
+
+def heartbeat():
+    with _guard():
+        _heartbeat()
+
+
+def take_queue(result=None):
+    # キューの依頼を取り出して空にする。result（直前の実行結果）で足りる分は落とす
+    from .runner import PHASES
+
+    with _guard():
+        queue = _read_queue()
+        _write_queue([])
+    queue = [dict(req, only=req["only"] or PHASES) for req in queue]
+    if result is not None:
+        queue = [r for r in (remaining(req, result) for req in queue) if r]
+    return queue
+
+
+def requeue(requests):
+    # 実行に失敗した依頼をキューの先頭に戻す（次の take_queue でほかの依頼とまとめて取り直す）
+    if not requests:
+        return
+    with _guard():
+        _write_queue(requests + _read_queue())
@@ -0,0 +1,112 @@
+import os
+
+# ====================================
+# 設定（環境変数は使うときに読む）
+# ====================================
+USERNAME = "zakibg"
+
+API_ROOT = "https://boardgamegeek.com/xmlapi2"
+API_THING = f"{API_ROOT}/thing"
+
+ROTATION_DAYS = 100
+
+# Thing の取り直し（schedule.plan_targets）
+THING_MAX_PER_RUN = 20          # 情報がないもの以外で1回に取得する上限
+THING_MAX_AGE_DAYS = 365        # stats が動かなくてもこの日数で取り直す
+FINGERPRINT_COUNT_DRIFT = 0.05  # usersrated / numowned の相対変化
+FINGERPRINT_AVERAGE_DRIFT = 0.05  # average の変化
+FINGERPRINT_MIN_BASE = 20       # 件数の少ないゲームで相対変化が過敏にならないように
+SLEEP_BETWEEN_CALLS = 1
+SLEEP_ON_429 = 60
+
+# collection の 202（エクスポート作成中）のポーリング
+COLLECTION_POLL_INITIAL = 2
+COLLECTION_POLL_MAX = 30
+COLLECTION_MAX_WAIT = 300
+
+# collection を取る subtype（並列に取得して1つにまとめる）
+COLLECTION_SUBTYPES = ["boardgame", "boardgameexpansion"]
+
+# collection の差分取得（modifiedsince）
+# 前回の同期日から COLLECTION_SYNC_OVERLAP_DAYS 日さかのぼって取る（BGG 側の時刻とのずれ対策）
+# 削除の検出と統計の更新のため COLLECTION_FULL_SYNC_DAYS 日ごとに全件取得する
+COLLECTION_SYNC_OVERLAP_DAYS = 1
+COLLECTION_FULL_SYNC_DAYS = 7
+
+# Thing 取得のリトライ方針とサーキットブレーカー
+THING_MAX_ATTEMPTS = 5          # 1件あたりの最大試行回数
+THING_RETRY_BUDGET = 30         # 1回の実行でのリトライ総数
+THING_BACKOFF_202 = 5           # 202 の待ち時間（試行ごとに倍）
+THING_BACKOFF_MAX = 120
+THING_BREAKER_WINDOW = 10       # 直近何件の結果でエラー率を見るか
+THING_BREAKER_MIN_CALLS = 5
+THING_BREAKER_THRESHOLD = 0.5
+# 取得に失敗したアイテムは次に試すまで 1, 2, 4, ... 日あける（最大この日数）
+THING_FAILURE_BACKOFF_MAX_DAYS = 30
+
+# Thing から取って保存する項目。THING_REQUIRED_KEYS が欠けていれば missing thing data として必ず取る
+# 拡張のリンク（expands: 本体の objectid, expansions: 拡張の objectid）と別名（altnames）は
+# 後から足した項目なので、欠けているものは THING_MAX_PER_RUN の枠内で少しずつ埋める
+THING_REQUIRED_KEYS = ["designers", "mechanics", "categories", "weight", "type", "minage"]
+THING_KEYS = THING_REQUIRED_KEYS + ["expands", "expansions", "altnames"]
+
+OUTPUT_PATH = "bgg_collection.json"
+# キー順・数値表記・同名ソートを固定して、実際に変わったアイテムだけが差分に出るようにする
+CANONICAL_OUTPUT = True
+# minified / gzip / 辞書エンコード版などの派生ファイル
+OUTPUT_DIR = "output"
+# シートがそのまま setValues できる行データ
+ROWS_PATH = os.path.join(OUTPUT_DIR, "bgg_rows.json")
+# objectid → bgg_collection.json 内のバイト位置（index.CollectionIndex で読む）
+INDEX_PATH = os.path.join(OUTPUT_DIR, "bgg_collection.index.json")
+# ゲーム名（別名を含む）の n-gram インデックス（search.NameIndex）
+NAMES_INDEX_PATH = os.path.join(OUTPUT_DIR, "bgg_names.index.json")
+# ステータス・メカニクス別の件数や Weight / 評価 / ランクの分布（stats.write_facets）
+STATS_PATH = os.path.join(OUTPUT_DIR, "bgg_stats.json")
+# プレイ記録の月別・ゲーム別の集計（plays.write_plays_stats）
+PLAYS_STATS_PATH = os.path.join(OUTPUT_DIR, "bgg_plays.json")
+# 本体ごとに拡張をまとめたビュー（links.grouped_view）
+GROUPS_PATH = os.path.join(OUTPUT_DIR, "bgg_groups.json")
+# ステータス別・objectid 範囲別のシャードと manifest.json
+SHARD_DIR = os.path.join(OUTPUT_DIR, "shards")
+# bggfetch serve（読み取り専用の HTTP サーバー）
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8765
+SERVE_PAGE_SIZE = 50
+SERVE_MAX_PAGE_SIZE = 500
+# bgg_collection.json の更新を確認する間隔（秒）
+SERVE_RELOAD_INTERVAL = 2
+SERVE_ACCESS_LOG = False
+# bggfetch daemon（常駐モード）
+# フェーズごとの実行間隔（秒）。thing は DAEMON_THING_BATCH 件ずつ少しずつ進める
+DAEMON_INTERVALS = {"collection": 6 * 60 * 60, "plays": 60 * 60, "thing": 10 * 60}
+DAEMON_THING_BATCH = 5
+# 全レーンで共有する API の呼び出しレート（回/秒）とまとめて呼べる回数
+DAEMON_RATE = 0.5
+DAEMON_BURST = 2
+# キューを見に行く間隔・失敗したときに次に試すまで（秒）
+DAEMON_POLL = 5
+DAEMON_RETRY_DELAY = 5 * 60
+DAEMON_HEARTBEAT = 60
+# 次回の起動用の状態（Actions のキャッシュで引き継ぐ。git には入れない）
+STATE_DIR = "state"
+SNAPSHOT_PATH = os.path.join(STATE_DIR, "snapshot.bin")
+# 同時実行の抑止（実行中のロック / 実行中に来た依頼のキュー）
+LOCK_PATH = os.path.join(STATE_DIR, "run.lock")
+QUEUE_PATH = os.path.join(STATE_DIR, "run.queue.json")
+# 集計の差分更新用（アイテムごとの集計行とハッシュ）
+STATS_STATE_PATH = os.path.join(STATE_DIR, "stats.bin")
+# 取得したプレイ記録と月ごとの集計
+PLAYS_STATE_PATH = os.path.join(STATE_DIR, "plays.bin")
+LOCK_STALE_SECONDS = 3 * 60 * 60
+
+
+def api_token():
+    token = os.environ.get("BGG_API_TOKEN")
+    if not token:
+        raise RuntimeError("BGG_API_TOKEN is not set")
+    return token
+
+
+def auth_headers():
+    return {"Authorization": f"Bearer {api_token()}"}
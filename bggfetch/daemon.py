@@ -0,0 +1,113 @@
+import datetime
+import signal
+import time
+
+from . import api, config
+from .coalesce import heartbeat, hold_lock, merge, requeue, take_queue
+from .retry import RateBudget
+
+# ====================================
+# 常駐モード
+# ====================================
+# プロセスを起動したままにして、インタプリタの起動・HTTP 接続を使い回す。
+# ジョブは3つのレーンに分け、空いたときに優先度の高いものから1つずつ実行する:
+#   interactive: run の依頼（daemon がロックを持っているので bggfetch run はキューに入る）
+#                失敗したらキューに戻し、DAEMON_RETRY_DELAY 秒後にまとめて取り直す
+#   scheduled:   JST の日付が変わったら全フェーズの通常実行（毎日の更新と同じ。1日は plays を全件取り直し、
+#                サマリーのメールも送る）、それ以外は collection / plays を DAEMON_INTERVALS ごとに
+#   background:  Thing を DAEMON_THING_BATCH 件ずつ（interactive を長く待たせない）
+# API の呼び出しは全レーンで1つの RateBudget を通す（429 を受けたら全レーンが止まる）。
+
+LANES = ["interactive", "scheduled", "background"]
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _next_daily(ts):
+    # ts の次の JST 0時（GitHub Actions の毎日の実行と同じ時刻）
+    from .runner import JST
+
+    tomorrow = datetime.datetime.fromtimestamp(ts, JST).date() + datetime.timedelta(days=1)
+    return datetime.datetime.combine(tomorrow, datetime.time(), JST).timestamp()
+
+
+def next_job(due, result, now):
+    # 戻り値: (レーン, only, ids, thing_limit, 取り出した依頼) または None
+    if due["interactive"] <= now:
+        queue = take_queue(result)
+        if queue:
+            only, ids = merge(queue)
+            return "interactive", only, ids, None, queue
+    if due["daily"] <= now:
+        return "scheduled", None, None, None, []
+    for phase in ["collection", "plays"]:
+        if due[phase] <= now:
+            return "scheduled", [phase], None, None, []
+    if due["thing"] <= now:
+        return "background", ["thing"], None, config.DAEMON_THING_BATCH, []
+    return None
+
+
+def run_daemon(username=config.USERNAME, run_fn=None):
+    from .runner import PHASES, run
+
+    run_fn = run_fn or run
+    api.RATE_BUDGET = RateBudget(config.DAEMON_RATE, config.DAEMON_BURST)
+    signal.signal(signal.SIGTERM, _stop)
+
+    now = time.time()
+    due = {phase: now for phase in PHASES}
+    due["interactive"] = now
+    # 起動直後は通常実行から始める（各フェーズの予定もそこで決まる）
+    due["daily"] = now
+    counts = dict.fromkeys(LANES, 0)
+    result = None
+    last_heartbeat = 0.0
+
+    with hold_lock():
+        print(f"Daemon started for {username}")
+        try:
+            while True:
+                now = time.time()
+                if now - last_heartbeat >= config.DAEMON_HEARTBEAT:
+                    heartbeat()
+                    last_heartbeat = now
+
+                job = next_job(due, result, now)
+                if job is None:
+                    time.sleep(config.DAEMON_POLL)
+                    continue
+
+                lane, only, ids, thing_limit, requests = job
+                print(f"[{lane}] {', '.join(only or PHASES)}" + (f" ids={' '.join(ids)}" if ids else ""))
+                try:
+                    result = run_fn(username, only=only, ids=ids, thing_limit=thing_limit)
+                except Exception as e:
+                    print(f"[{lane}] failed: {e}")
+                    if requests:
+                        # 依頼は取り出し済みなので、落とさないようにキューに戻す
+                        requeue(requests)
+                        due["interactive"] = time.time() + config.DAEMON_RETRY_DELAY
+                        continue
+                    for phase in (only or PHASES + ["daily"]):
+                        due[phase] = max(due[phase], time.time() + config.DAEMON_RETRY_DELAY)
+                    continue
+                counts[lane] += 1
+                finished = time.time()
+                if lane == "scheduled" and only is None:
+                    due["daily"] = _next_daily(finished)
+                for phase in only or PHASES:
+                    # interactive で取り直したフェーズも次の定期実行を後ろにずらす
+                    # （ids 指定の Thing は一部だけなので background の予定はそのまま）
+                    if phase == "thing" and ids:
+                        continue
+                    due[phase] = finished + config.DAEMON_INTERVALS[phase]
+                # 書き出しまでは済んだが取得に失敗したフェーズ（collection のタイムアウトなど）
+                for phase in (result or {}).get("errors", []):
+                    due[phase] = finished + config.DAEMON_RETRY_DELAY
+        except KeyboardInterrupt:
+            pass
+        finally:
+            print("Daemon stopped (" + ", ".join(f"{lane}: {n}" for lane, n in counts.items()) + ")")
@@ -0,0 +1,504 @@
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import unicodedata
+
+# json.dump(..., indent=2) と同じ書式でアイテム単位に書き出す
+ITEM_SEP = b",\n  "
+LIST_OPEN = b"[\n  "
+LIST_CLOSE = b"\n]"
+
+# 正規化モードでのトップレベルのキー順（未知のキーは末尾にアルファベット順）
+CANONICAL_KEY_ORDER = [
+    "objecttype", "objectid", "subtype", "collid", "name", "yearpublished",
+    "image", "thumbnail", "stats", "status", "numplays",
+    "designers", "mechanics", "categories", "weight", "type", "minage",
+    "expands", "expansions", "altnames", "lastplay",
+]
+# 数値文字列を正規化する対象（name などの文字列はそのまま）
+NUMERIC_KEYS = {"yearpublished", "stats", "numplays", "weight", "minage"}
+NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+# 辞書エンコード版で共有テーブルに置き換えるリスト
+DICT_KEYS = ["designers", "mechanics", "categories"]
+DICT_FORMAT_VERSION = 1
+
+# シート（updateBggSheetFromJson）の列と並び順
+SHEET_HEADERS = [
+    "ゲーム名", "プレイ回数", "最終プレイ日", "マイ評価", "平均評価", "ベイズ平均",
+    "Board Game Rank", "Family Game Rank", "Weight", "最小人数", "最大人数", "プレイ時間",
+    "対象年齢", "出版年", "デザイナー", "メカニクス", "カテゴリー", "タイプ", "ステータス", "ID",
+]
+STATUS_ORDER = {
+    "owned": 1,
+    "played(not owned)": 1,
+    "preordered": 2,
+    "wishlist": 3,
+    "previouslyowned": 4,
+}
+ROWS_FORMAT_VERSION = 1
+INDEX_FORMAT_VERSION = 1
+
+# objectid の範囲シャードの幅（0-99999, 100000-199999, ...）
+SHARD_ID_SPAN = 100000
+SHARD_FORMAT_VERSION = 1
+
+
+# ====================================
+# アイテム単位のシリアライズ
+# ====================================
+def item_hash(item):
+    # indent無しの dumps はC実装で速い。キー順も含めて同じなら整形結果も同じ
+    compact = json.dumps(item, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(compact.encode("utf-8")).hexdigest()
+
+
+def encode_item(item):
+    # リストの要素として入れ子になる分、2行目以降を2スペース下げる
+    text = json.dumps(item, ensure_ascii=False, indent=2)
+    return text.replace("\n", "\n  ").encode("utf-8")
+
+
+def split_export(data):
+    # 前回の出力をアイテムごとのバイト列に分割する
+    # indent=2 ではトップレベルの要素境界だけが "\n  },\n  {" になる
+    if data == b"[]":
+        return []
+    if not data.startswith(LIST_OPEN + b"{") or not data.endswith(b"}" + LIST_CLOSE):
+        return None
+    body = data[len(LIST_OPEN):-len(LIST_CLOSE)]
+    parts = body.split(b"\n  }" + ITEM_SEP + b"{")
+    frags = []
+    for i, p in enumerate(parts):
+        if i > 0:
+            p = b"{" + p
+        if i < len(parts) - 1:
+            p = p + b"\n  }"
+        frags.append(p)
+    return frags
+
+
+# ====================================
+# 正規化（git の差分を最小にする）
+# ====================================
+def normalize_number(text):
+    # "07" → "7", "2.50" → "2.5", "-0" → "0"
+    if not NUMBER_RE.fullmatch(text):
+        return text
+    negative = text.startswith("-")
+    int_part, _, frac = text.lstrip("-").partition(".")
+    out = int_part.lstrip("0") or "0"
+    frac = frac.rstrip("0")
+    if frac:
+        out += "." + frac
+    if negative and out != "0":
+        out = "-" + out
+    return out
+
+
+def _canonical_value(value, numeric):
+    if isinstance(value, dict):
+        return {k: _canonical_value(value[k], numeric) for k in sorted(value)}
+    if isinstance(value, list):
+        return [_canonical_value(v, numeric) for v in value]
+    if numeric and isinstance(value, str):
+        return normalize_number(value)
+    return value
+
+
+def canonicalize_item(item):
+    order = {k: i for i, k in enumerate(CANONICAL_KEY_ORDER)}
+    keys = sorted(item, key=lambda k: (order.get(k, len(order)), k))
+    return {k: _canonical_value(item[k], k in NUMERIC_KEYS) for k in keys}
+
+
+def canonical_sort_key(item):
+    # 同名のゲームは objectid → collid の順で並びを固定する
+    name = item.get("name", {}).get("value", "")
+    oid = item.get("objectid", "")
+    return (name.lower(), int(oid) if oid.isdigit() else 0, oid, item.get("collid", ""))
+
+
+def canonicalize(items):
+    return sorted((canonicalize_item(g) for g in items), key=canonical_sort_key)
+
+
+# ====================================
+# フラグメントキャッシュ
+# ====================================
+class FragmentCache:
+    def __init__(self):
+        self.fragments = {}
+        # 前回の出力に含まれていたアイテム（変更バイト数の集計用）
+        self.previous = {}
+        # from_spans 用：前回出力のバイト列と ハッシュ → (offset, length)
+        self._data = b""
+        self._spans = {}
+
+    @classmethod
+    def from_export(cls, data, items):
+        # data: 前回の bgg_collection.json のバイト列, items: それを json.loads した結果
+        cache = cls()
+        frags = split_export(data) if data else None
+        if frags is None or len(frags) != len(items):
+            return cache
+        for item, frag in zip(items, frags):
+            key = item_hash(item)
+            cache.fragments[key] = frag
+            cache.previous[key] = len(frag)
+        return cache
+
+    @classmethod
+    def from_spans(cls, data, spans):
+        # スナップショットに記録した位置から切り出す（JSON をパースしない）
+        cache = cls()
+        cache._data = data
+        cache._spans = spans
+        cache.previous = {key: length for key, (_, length) in spans.items()}
+        return cache
+
+    def fragment(self, item):
+        key = item_hash(item)
+        frag = self.fragments.get(key)
+        if frag is None:
+            span = self._spans.get(key)
+            if span is not None:
+                offset, length = span
+                frag = self._data[offset:offset + length]
+            else:
+                frag = encode_item(item)
+            self.fragments[key] = frag
+        return key, frag
+
+
+# ====================================
+# 書き出し
+# ====================================
+def encode_list(items, cache):
+    # write_collection と同じ書式のバイト列（シャード用）
+    if not items:
+        return b"[]"
+    frags = [cache.fragment(g)[1] for g in items]
+    return LIST_OPEN + ITEM_SEP.join(frags) + LIST_CLOSE
+
+
+def write_collection(path, items, cache=None):
+    # items は並び替え済みであること。変更のないアイテムは前回のバイト列を使い回す
+    # stats["offsets"] は各アイテムの (先頭バイト位置, バイト長)、stats["hashes"] は item_hash
+    # stats["changed_bytes"] は今回エンコードし直したアイテムのバイト数（bytes を超えない）、
+    # stats["removed_bytes"] は前回あって今回なくなったアイテムのバイト数
+    if cache is None:
+        cache = FragmentCache()
+
+    stats = {"items": len(items), "reused": 0, "encoded": 0, "bytes": 0, "changed_bytes": 0, "removed_bytes": 0,
+             "offsets": [], "hashes": []}
+    written = set()
+    digest = hashlib.sha256()
+    tmp_path = path + ".tmp"
+
+    with open(tmp_path, "wb") as f:
+        def put(data):
+            f.write(data)
+            digest.update(data)
+            stats["bytes"] += len(data)
+
+        if not items:
+            put(b"[]")
+        else:
+            put(LIST_OPEN)
+            for i, item in enumerate(items):
+                key, frag = cache.fragment(item)
+                written.add(key)
+                stats["hashes"].append(key)
+                if i > 0:
+                    put(ITEM_SEP)
+                stats["offsets"].append((stats["bytes"], len(frag)))
+                put(frag)
+                if key in cache.previous:
+                    stats["reused"] += 1
+                else:
+                    stats["encoded"] += 1
+                    stats["changed_bytes"] += len(frag)
+            put(LIST_CLOSE)
+
+    # 前回あって今回なくなったアイテム（変更前の版を含む）の分は別に数える
+    stats["removed_bytes"] = sum(n for key, n in cache.previous.items() if key not in written)
+    stats["sha256"] = digest.hexdigest()
+
+    os.replace(tmp_path, path)
+    return stats
+
+
+# ====================================
+# コンパクト版（minified / gzip / 辞書エンコード）
+# ====================================
+def encode_minified(items):
+    return json.dumps(items, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dict_encode(items):
+    # designers / mechanics / categories を共有文字列テーブルへの番号に置き換える
+    # テーブルはソート済みにして、出現順の揺れで差分が出ないようにする
+    tables = {}
+    for key in DICT_KEYS:
+        values = set()
+        for g in items:
+            values.update(g.get(key) or [])
+        tables[key] = sorted(values)
+
+    refs = {key: {v: i for i, v in enumerate(tables[key])} for key in DICT_KEYS}
+    encoded = []
+    for g in items:
+        e = dict(g)
+        for key in DICT_KEYS:
+            if isinstance(g.get(key), list):
+                e[key] = [refs[key][v] for v in g[key]]
+        encoded.append(e)
+
+    return {"version": DICT_FORMAT_VERSION, "tables": tables, "items": encoded}
+
+
+def dict_decode(doc):
+    if doc.get("version") != DICT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported dict format version: {doc.get('version')}")
+    tables = doc["tables"]
+    items = []
+    for e in doc["items"]:
+        g = dict(e)
+        for key in DICT_KEYS:
+            if isinstance(e.get(key), list):
+                g[key] = [tables[key][i] for i in e[key]]
+        items.append(g)
+    return items
+
+
+def write_if_changed(path, data):
+    # 内容が同じならファイルに触らない
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def write_variants(out_dir, items, basename="bgg_collection"):
+    # 戻り値: {パス: バイト数}
+    os.makedirs(out_dir, exist_ok=True)
+    minified = encode_minified(items)
+    variants = {
+        f"{basename}.min.json": minified,
+        # mtime=0 にして同じ内容なら同じバイト列になるようにする
+        f"{basename}.min.json.gz": gzip.compress(minified, compresslevel=9, mtime=0),
+        f"{basename}.dict.json": json.dumps(
+            dict_encode(items), ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8"),
+    }
+    sizes = {}
+    for name, data in variants.items():
+        path = os.path.join(out_dir, name)
+        write_if_changed(path, data)
+        sizes[path] = len(data)
+    return sizes
+
+
+# ====================================
+# シート用の行データ（setValues にそのまま渡せる形）
+# ====================================
+def _value(obj):
+    # Apps Script の extractValue と同じ
+    if isinstance(obj, dict) and "value" in obj:
+        return obj["value"]
+    return obj
+
+
+def _format_num(val):
+    # Apps Script の formatNum と同じ（小数2桁で四捨五入、数値でなければ空文字）
+    if val is None or val == "":
+        return ""
+    try:
+        x = float(val)
+    except (TypeError, ValueError):
+        return ""
+    if math.isnan(x) or math.isinf(x):
+        return ""
+    r = math.floor(x * 100 + 0.5) / 100
+    return int(r) if r.is_integer() else r
+
+
+def _rank(ranks, rank_name):
+    if isinstance(ranks, dict):
+        ranks = [ranks]
+    for r in ranks or []:
+        if r and r.get("name") == rank_name:
+            val = _value(r)
+            if val and val != "0" and val != "Not Ranked":
+                return val
+            break
+    return "N/A"
+
+
+def _blank(val):
+    return "" if val is None else val
+
+
+def sheet_row(g):
+    stats = g.get("stats") or {}
+    rating = stats.get("rating") or {}
+    ranks = (rating.get("ranks") or {}).get("rank")
+    return [
+        _value(g.get("name")),
+        _value(g.get("numplays")) or 0,
+        g.get("lastplay") or "",
+        _blank(_value(rating.get("value"))),
+        _format_num(_value(rating.get("average"))),
+        _format_num(_value(rating.get("bayesaverage"))),
+        _rank(ranks, "boardgame"),
+        _rank(ranks, "familygames"),
+        _format_num(g.get("weight")),
+        _blank(stats.get("minplayers")),
+        _blank(stats.get("maxplayers")),
+        _blank(stats.get("playingtime")),
+        _value(g.get("minage")) or _value(stats.get("minage")) or "",
+        _blank(_value(g.get("yearpublished"))),
+        ", ".join(g.get("designers") or []),
+        ", ".join(g.get("mechanics") or []),
+        ", ".join(g.get("categories") or []),
+        g.get("type") or "",
+        g.get("status") or "",
+        g.get("objectid"),
+    ]
+
+
+def _name_collation_key(name):
+    # localeCompare の近似：アクセントと大文字小文字を無視して比較し、同じなら元の文字列で
+    base = "".join(
+        c for c in unicodedata.normalize("NFKD", name) if not unicodedata.combining(c)
+    )
+    return (base.casefold(), name)
+
+
+def sheet_rows(items):
+    # 最終プレイ日の新しい順 → ステータス順 → ゲーム名（シートの並び替えと同じ）
+    rows = [sheet_row(g) for g in items]
+    rows.sort(key=lambda r: (
+        STATUS_ORDER.get(r[18], 99),
+        _name_collation_key(r[0] or ""),
+    ))
+    played = [r for r in rows if r[2] and r[2] != "N/A"]
+    unplayed = [r for r in rows if not r[2] or r[2] == "N/A"]
+    played.sort(key=lambda r: r[2], reverse=True)
+    return played + unplayed
+
+
+def write_rows(path, items):
+    doc = {"version": ROWS_FORMAT_VERSION, "headers": SHEET_HEADERS, "rows": sheet_rows(items)}
+    data = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    write_if_changed(path, data)
+    return len(data)
+
+
+# ====================================
+# ランダムアクセス用インデックス
+# ====================================
+def build_index(export_path, index_path, items, write_stats):
+    # objectid → (offset, length)。読み出しは index.CollectionIndex を使う
+    entries = {}
+    for g, span in zip(items, write_stats["offsets"]):
+        entries[g["objectid"]] = list(span)
+
+    by_name = [g["objectid"] for g in sorted(items, key=canonical_sort_key)]
+    # 最終プレイ日の新しい順、未プレイは名前順で末尾
+    played = sorted(
+        (g for g in items if g.get("lastplay")),
+        key=lambda g: (g["lastplay"], g["objectid"]),
+        reverse=True,
+    )
+    unplayed = sorted((g for g in items if not g.get("lastplay")), key=canonical_sort_key)
+
+    return {
+        "version": INDEX_FORMAT_VERSION,
+        # インデックスファイルからの相対パス（URL でもそのまま urljoin できる）
+        "file": os.path.relpath(export_path, os.path.dirname(index_path) or ".").replace(os.sep, "/"),
+        "size": write_stats["bytes"],
+        "sha256": write_stats["sha256"],
+        "items": entries,
+        "by_name": by_name,
+        "by_lastplay": [g["objectid"] for g in played + unplayed],
+    }
+
+
+def write_index(export_path, index_path, items, write_stats):
+    doc = build_index(export_path, index_path, items, write_stats)
+    data = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    write_if_changed(index_path, data)
+    return len(data)
+
+
+# ====================================
+# シャード（ステータス別 / objectid 範囲別）
+# ====================================
+def _slug(text):
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-") or "unknown"
+
+
+def shard_groups(items):
+    groups = {}
+    for g in items:
+        groups.setdefault(f"status/{_slug(g.get('status') or 'unknown')}", []).append(g)
+    for g in items:
+        oid = int(g["objectid"])
+        lo = oid - oid % SHARD_ID_SPAN
+        groups.setdefault(f"id/{lo}-{lo + SHARD_ID_SPAN - 1}", []).append(g)
+    return groups
+
+
+def write_shards(shard_dir, items, cache=None):
+    # 各シャードは bgg_collection.json と同じ書式。manifest.json にハッシュと件数を記録し、
+    # 利用側はハッシュが変わったシャードだけ取り直せばよい
+    if cache is None:
+        cache = FragmentCache()
+    manifest_path = os.path.join(shard_dir, "manifest.json")
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            old_shards = json.load(f).get("shards", {})
+    except (FileNotFoundError, ValueError):
+        old_shards = {}
+
+    shards = {}
+    for name, group in sorted(shard_groups(items).items()):
+        data = encode_list(group, cache)
+        path = os.path.join(shard_dir, name + ".json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_if_changed(path, data)
+        shards[name] = {
+            "path": name + ".json",
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "count": len(group),
+            "bytes": len(data),
+        }
+
+    # 今回なくなったシャード（例: preordered が0件になった）は削除する
+    for name, info in old_shards.items():
+        if name not in shards:
+            try:
+                os.remove(os.path.join(shard_dir, info["path"]))
+            except FileNotFoundError:
+                pass
+
+    manifest = {"version": SHARD_FORMAT_VERSION, "id_span": SHARD_ID_SPAN, "shards": shards}
+    data = json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")
+    write_if_changed(manifest_path, data)
+    return {
+        "shards": len(shards),
+        "changed": sum(1 for n, s in shards.items() if old_shards.get(n, {}).get("sha256") != s["sha256"]),
+        "bytes": sum(s["bytes"] for s in shards.values()) + len(data),
+    }
@@ -0,0 +1,109 @@
+import json
+import mmap
+import os
+
+from .export import INDEX_FORMAT_VERSION
+
+
+# ====================================
+# bgg_collection.json のランダムアクセス読み出し
+# ====================================
+class CollectionIndex:
+    def __init__(self, doc, base=""):
+        if doc.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index version: {doc.get('version')}")
+        self.doc = doc
+        # インデックスの置き場所（ローカルパスのディレクトリ、または URL）
+        self.base = base
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), os.path.dirname(os.path.abspath(path)))
+
+    @classmethod
+    def load_url(cls, url):
+        import urllib.request
+
+        with urllib.request.urlopen(url, timeout=60) as resp:
+            return cls(json.loads(resp.read()), url)
+
+    def __len__(self):
+        return len(self.doc["items"])
+
+    def __contains__(self, objectid):
+        return str(objectid) in self.doc["items"]
+
+    @property
+    def by_name(self):
+        return self.doc["by_name"]
+
+    @property
+    def by_lastplay(self):
+        return self.doc["by_lastplay"]
+
+    def span(self, objectid):
+        offset, length = self.doc["items"][str(objectid)]
+        return offset, length
+
+    def range_header(self, objectid):
+        # HTTP Range ヘッダ用（末尾は inclusive）
+        offset, length = self.span(objectid)
+        return f"bytes={offset}-{offset + length - 1}"
+
+    def export_path(self):
+        return os.path.join(self.base, self.doc["file"])
+
+    def export_url(self):
+        import urllib.parse
+
+        return urllib.parse.urljoin(self.base, self.doc["file"])
+
+    # ------------------------------------
+    # ローカルファイル（mmap）
+    # ------------------------------------
+    def read(self, objectid, path=None):
+        return self.read_many([objectid], path)[0]
+
+    def read_many(self, objectids, path=None):
+        path = path or self.export_path()
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size != self.doc["size"]:
+                raise ValueError(f"{path} does not match the index (size differs)")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                out = []
+                for oid in objectids:
+                    offset, length = self.span(oid)
+                    out.append(json.loads(mm[offset:offset + length]))
+                return out
+
+    # ------------------------------------
+    # HTTP Range
+    # ------------------------------------
+    def fetch(self, objectid, url=None):
+        import urllib.request
+
+        url = url or self.export_url()
+        req = urllib.request.Request(url, headers={"Range": self.range_header(objectid)})
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            data = resp.read()
+            if resp.status != 206:
+                # Range 非対応のサーバーは全体を返してくる
+                offset, length = self.span(objectid)
+                data = data[offset:offset + length]
+        return json.loads(data)
+
+
+# ====================================
+# シャードの差分同期
+# ====================================
+def changed_shards(old_manifest, new_manifest, names=None):
+    # 前回同期したマニフェストとハッシュが違うシャード名を返す（names で絞り込み可）
+    old = (old_manifest or {}).get("shards", {})
+    out = []
+    for name, info in new_manifest["shards"].items():
+        if names is not None and name not in names:
+            continue
+        if old.get(name, {}).get("sha256") != info["sha256"]:
+            out.append(name)
+    return out
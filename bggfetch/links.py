@@ -0,0 +1,138 @@
+import json
+
+from .export import write_if_changed
+
+# ====================================
+# 拡張 → 本体のリンク
+# ====================================
+# Thing の boardgameexpansion リンク（expands: 本体, expansions: 拡張）から
+# コレクション内の隣接インデックスを作り、本体ごとにまとめたビューを書き出す。
+# 片方のアイテムにしかリンクがなくても（本体側の Thing がまだ古い等）つながるように両方向を見る。
+
+GROUPS_FORMAT_VERSION = 1
+
+
+def is_expansion(g):
+    return g.get("type") == "boardgameexpansion" or g.get("subtype") == "boardgameexpansion"
+
+
+def _sort_ids(ids):
+    return sorted(ids, key=lambda oid: (len(oid), oid))
+
+
+def build_link_index(items):
+    # 戻り値: {"parents": 拡張 → 本体のリスト, "children": 本体 → 拡張のリスト}
+    # どちらもコレクション内のアイテムだけ
+    ids = {g["objectid"] for g in items}
+    parents = {}
+    for g in items:
+        oid = g["objectid"]
+        for base in g.get("expands") or []:
+            if base in ids and base != oid:
+                parents.setdefault(oid, set()).add(base)
+        for exp in g.get("expansions") or []:
+            if exp in ids and exp != oid:
+                parents.setdefault(exp, set()).add(oid)
+
+    children = {}
+    for exp, bases in parents.items():
+        for base in bases:
+            children.setdefault(base, set()).add(exp)
+
+    return {
+        "parents": {oid: _sort_ids(v) for oid, v in parents.items()},
+        "children": {oid: _sort_ids(v) for oid, v in children.items()},
+    }
+
+
+def _descendants(oid, children):
+    # 拡張の拡張もたどる
+    out = []
+    seen = {oid}
+    stack = list(reversed(children.get(oid, [])))
+    while stack:
+        child = stack.pop()
+        if child in seen:
+            continue
+        seen.add(child)
+        out.append(child)
+        stack.extend(reversed(children.get(child, [])))
+    return out
+
+
+def _has_base(oid, parents, by_id):
+    seen = {oid}
+    stack = list(parents.get(oid, []))
+    while stack:
+        p = stack.pop()
+        if p in seen:
+            continue
+        seen.add(p)
+        if not is_expansion(by_id[p]):
+            return True
+        stack.extend(parents.get(p, []))
+    return False
+
+
+def _numplays(g):
+    try:
+        return int((g.get("numplays") or {}).get("value") or 0)
+    except ValueError:
+        return 0
+
+
+def _entry(g):
+    return {
+        "objectid": g["objectid"],
+        "name": g["name"]["value"],
+        "status": g.get("status"),
+        "numplays": _numplays(g),
+        "lastplay": g.get("lastplay"),
+    }
+
+
+def grouped_view(items, index=None):
+    # items: 並び替え済みのアイテム
+    # groups: 本体（拡張でないアイテム）ごとに、コレクション内の拡張とプレイ回数・最終プレイ日の合計
+    # orphans: 本体がコレクションにない拡張
+    # unlinked: まだリンク情報を取っていない拡張
+    index = index or build_link_index(items)
+    by_id = {g["objectid"]: g for g in items}
+    children = index["children"]
+    parents = index["parents"]
+
+    groups = []
+    for g in items:
+        if is_expansion(g):
+            continue
+        group = _entry(g)
+        expansions = [_entry(by_id[oid]) for oid in _descendants(g["objectid"], children)]
+        group["expansions"] = expansions
+        group["owned_expansions"] = sum(1 for e in expansions if e["status"] == "owned")
+        group["total_numplays"] = group["numplays"] + sum(e["numplays"] for e in expansions)
+        dates = [d for d in [group["lastplay"]] + [e["lastplay"] for e in expansions] if d]
+        group["total_lastplay"] = max(dates) if dates else None
+        groups.append(group)
+
+    orphans = []
+    unlinked = []
+    for g in items:
+        if not is_expansion(g):
+            continue
+        if g["objectid"] in parents:
+            # 拡張の拡張は、たどった先に本体があればそのグループに入っている
+            if not _has_base(g["objectid"], parents, by_id):
+                orphans.append(_entry(g))
+        elif "expands" in g:
+            orphans.append(_entry(g))
+        else:
+            unlinked.append(_entry(g))
+
+    return {"version": GROUPS_FORMAT_VERSION, "groups": groups, "orphans": orphans, "unlinked": unlinked}
+
+
+def write_groups(path, items):
+    doc = grouped_view(items)
+    data = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    write_if_changed(path, data)
+    return len(data)
@@ -0,0 +1,55 @@
+import os
+
+from . import api
+
+
+# ====================================
+# メール
+# ====================================
+def send_email(updated_count, total_count, target_info, is_monthly_refresh, write_stats=None, output_sizes=None, notes=None):
+    EMAIL_FROM = os.environ.get("EMAIL_FROM")
+    EMAIL_TO = os.environ.get("EMAIL_TO")
+    EMAIL_USER = os.environ.get("EMAIL_USER")
+    EMAIL_PASS = os.environ.get("EMAIL_PASS")
+
+    if not all([EMAIL_FROM, EMAIL_TO, EMAIL_USER, EMAIL_PASS]):
+        return
+
+    # メールを送るときだけ読み込む
+    import smtplib
+    from email.mime.text import MIMEText
+
+    total_api_calls = updated_count + api.COLLECTION_CALLS + api.PLAYS_CALLS
+    subject = f"BGG_Collection Updated: {total_api_calls} API Calls"
+
+    body = (
+        f"Plays sync mode: {'FULL REFRESH' if is_monthly_refresh else 'INCREMENTAL'}\n"
+        f"Total games: {total_count}\n"
+        f"Thing updated today: {updated_count}\n"
+        f"Collection API calls: {api.COLLECTION_CALLS}\n"
+        f"Plays API calls: {api.PLAYS_CALLS}\n"
+    )
+    if write_stats:
+        body += (
+            f"Items changed: {write_stats['encoded']}\n"
+            f"Bytes changed: {write_stats['changed_bytes']} / {write_stats['bytes']}\n"
+            f"Bytes removed: {write_stats['removed_bytes']}\n"
+        )
+    if output_sizes:
+        body += "".join(f"{path}: {size} bytes\n" for path, size in output_sizes.items())
+    if notes:
+        body += "".join(f"{line}\n" for line in notes)
+    body += (
+        "\n"
+        f"Targets ({len(target_info)}):\n"
+        + "\n".join(target_info)
+    )
+
+    msg = MIMEText(body)
+    msg["Subject"] = subject
+    msg["From"] = EMAIL_FROM
+    msg["To"] = EMAIL_TO
+
+    with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
+        smtp.login(EMAIL_USER, EMAIL_PASS)
+        smtp.send_message(msg)
@@ -0,0 +1,255 @@
+import datetime
+import json
+import marshal
+import os
+
+from .export import write_if_changed
+
+# ====================================
+# プレイ記録の集計（月別・ゲーム別）
+# ====================================
+# 取得したプレイ記録（play id, 日付, objectid, 回数）を月ごとに state に貯め、
+# 月ごとの集計（objectid → 回数・遊んだ日）をキャッシュしておく。
+# 新しく取れた記録・変わった記録・消えた記録のある月の集計だけを作り直し、
+# ゲーム別（初プレイ日・最終プレイ日・連続月数）や H-index、
+# 「はじめて遊んだ」タイムラインは月ごとの集計から組み立てる（全記録は舐めない）。
+# 通常の実行で取れるのは最新のページだけなので、消えた記録は全件取得のときに反映される。
+# 出力はコミットされるので、今日の日付で変わる値（ほこり日数など）は入れない
+# （with_dust / serve の /plays で読むときに足す）。
+
+PLAYS_FORMAT_VERSION = 1
+PLAYS_STATE_VERSION = 1
+
+# game_rows の列
+GAME_COLUMNS = ["objectid", "name", "first", "last", "plays", "days", "months", "streak"]
+
+
+def _month(date):
+    return date[:7]
+
+
+def _ordinal(date):
+    return datetime.date.fromisoformat(date).toordinal()
+
+
+def _next_month(month):
+    y, m = int(month[:4]), int(month[5:])
+    return f"{y + m // 12:04d}-{m % 12 + 1:02d}"
+
+
+def empty_history():
+    return {"plays": {}, "where": {}, "names": {}, "months": {}}
+
+
+def load_history(path):
+    try:
+        with open(path, "rb") as f:
+            state = marshal.load(f)
+    except (FileNotFoundError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(state, dict) or state.get("version") != PLAYS_STATE_VERSION:
+        return None
+    return state
+
+
+def save_history(path, state):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        marshal.dump(dict(state, version=PLAYS_STATE_VERSION), f)
+    os.replace(tmp_path, path)
+
+
+def merge_plays(state, records, full):
+    # state["plays"]: 月 → {play id: (日付, objectid, 回数)}、state["where"]: play id → 月
+    # records: api.fetch_plays の結果。full なら取れなかった記録は消す
+    # 戻り値: 記録が増えた・変わった・消えた月の集合
+    plays = state["plays"]
+    names = state["names"]
+    incoming = {}
+    for r in records:
+        try:
+            _ordinal(r["date"])
+        except ValueError:
+            # 日付なし（0000-00-00）の記録は集計できない
+            continue
+        incoming[r["id"]] = (r["date"], r["objectid"], r["quantity"])
+        if r.get("name"):
+            names[r["objectid"]] = r["name"]
+
+    where = state["where"]
+    touched = set()
+    for pid, rec in incoming.items():
+        old_month = where.get(pid)
+        if old_month is not None:
+            if plays[old_month][pid] == rec:
+                continue
+            # 日付が変わった記録は元の月から外す
+            del plays[old_month][pid]
+            touched.add(old_month)
+        month = _month(rec[0])
+        plays.setdefault(month, {})[pid] = rec
+        where[pid] = month
+        touched.add(month)
+    if full:
+        for pid in [pid for pid in where if pid not in incoming]:
+            month = where.pop(pid)
+            del plays[month][pid]
+            touched.add(month)
+    for month in touched:
+        if not plays.get(month):
+            plays.pop(month, None)
+    return touched
+
+
+def month_bucket(month_plays):
+    # 戻り値: objectid → (回数, 遊んだ日の通し番号のタプル)
+    counts = {}
+    days = {}
+    for date, oid, quantity in month_plays.values():
+        counts[oid] = counts.get(oid, 0) + quantity
+        days.setdefault(oid, set()).add(_ordinal(date))
+    return {oid: (counts[oid], tuple(sorted(days[oid]))) for oid in counts}
+
+
+def update_history(state, records, full):
+    # 戻り値: (新しい state, 集計を作り直した月の数)
+    if state is None:
+        state = empty_history()
+    touched = merge_plays(state, records, full)
+    months = state["months"]
+    for month in touched:
+        if month in state["plays"]:
+            months[month] = month_bucket(state["plays"][month])
+        else:
+            months.pop(month, None)
+    return state, len(touched)
+
+
+def h_index(counts):
+    # h 回以上遊んだゲームが h 個以上ある最大の h
+    h = 0
+    for i, n in enumerate(sorted(counts, reverse=True), 1):
+        if n < i:
+            break
+        h = i
+    return h
+
+
+def _longest_run(sorted_keys, step):
+    # 戻り値: (長さ, 始まり, 終わり)。step(a) が b なら a, b は連続
+    best = (0, None, None)
+    start = prev = None
+    length = 0
+    for key in sorted_keys:
+        if prev is not None and step(prev) == key:
+            length += 1
+        else:
+            start, length = key, 1
+        if length > best[0]:
+            best = (length, start, key)
+        prev = key
+    return best
+
+
+def _iso(ordinal):
+    return datetime.date.fromordinal(ordinal).isoformat()
+
+
+def build_plays_stats(state):
+    names = state["names"]
+    games = {}
+    timeline = {}
+    all_days = set()
+    years = {}
+    for month in sorted(state["months"]):
+        bucket = state["months"][month]
+        year = years.setdefault(month[:4], {})
+        entry = timeline[month] = {"plays": 0, "games": len(bucket), "new": []}
+        for oid, (count, days) in bucket.items():
+            entry["plays"] += count
+            year[oid] = year.get(oid, 0) + count
+            all_days.update(days)
+            g = games.get(oid)
+            if g is None:
+                g = games[oid] = {"first": days[0], "last": days[-1], "plays": 0, "days": 0, "months": []}
+                entry["new"].append(oid)
+            g["last"] = days[-1]
+            g["plays"] += count
+            g["days"] += len(days)
+            g["months"].append(month)
+        entry["new"].sort()
+
+    rows = []
+    for oid, g in games.items():
+        streak = _longest_run(g["months"], _next_month)[0]
+        rows.append([
+            oid, names.get(oid, ""), _iso(g["first"]), _iso(g["last"]),
+            g["plays"], g["days"], len(g["months"]), streak,
+        ])
+    rows.sort(key=lambda r: (-r[4], r[0]))
+
+    days = sorted(all_days)
+    longest, start, end = _longest_run(days, lambda d: d + 1)
+    # 最後に遊んだ日までの連続日数（続行中かどうかは読む側が今日の日付と比べる）
+    latest = 0
+    while days and days[-1] - latest in all_days:
+        latest += 1
+
+    return {
+        "version": PLAYS_FORMAT_VERSION,
+        "plays": sum(r[4] for r in rows),
+        "games": len(rows),
+        "days": len(all_days),
+        "h_index": h_index([r[4] for r in rows]),
+        "streak": {
+            "longest": longest,
+            "from": _iso(start) if start else None,
+            "to": _iso(end) if end else None,
+            "latest": latest,
+            "latest_to": _iso(days[-1]) if days else None,
+        },
+        "years": {
+            year: {"plays": sum(counts.values()), "games": len(counts), "h_index": h_index(counts.values())}
+            for year, counts in sorted(years.items())
+        },
+        "months": timeline,
+        "game_columns": GAME_COLUMNS,
+        "game_rows": rows,
+    }
+
+
+def with_dust(doc, today):
+    # build_plays_stats の結果に今日の日付で決まる値を足す
+    # dust: 最後に遊んでからの日数、streak.current: 今日か昨日まで続いている連続日数
+    last = GAME_COLUMNS.index("last")
+    today_ordinal = today.toordinal()
+    out = dict(doc, as_of=today.isoformat(), game_columns=GAME_COLUMNS + ["dust"])
+    out["game_rows"] = [row + [today_ordinal - _ordinal(row[last])] for row in doc["game_rows"]]
+    streak = doc["streak"]
+    current = 0
+    if streak["latest_to"] and today_ordinal - _ordinal(streak["latest_to"]) <= 1:
+        current = streak["latest"]
+    out["streak"] = dict(streak, current=current)
+    return out
+
+
+def write_plays_stats(path, state_path, records, full):
+    # records: api.fetch_plays の結果（None なら保存済みの記録だけで作り直す）
+    # 戻り値: (バイト数, 集計を作り直した月の数)
+    state = load_history(state_path)
+    touched = 0
+    if records is not None:
+        state, touched = update_history(state, records, full)
+    elif state is None:
+        # state/ は Actions のキャッシュにしかないので、手元で記録がないときは
+        # コミット済みの bgg_plays.json を空の集計で上書きしない
+        try:
+            return os.path.getsize(path), 0
+        except FileNotFoundError:
+            state = empty_history()
+    data = json.dumps(build_plays_stats(state), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    write_if_changed(path, data)
+    if touched:
+        save_history(state_path, state)
+    return len(data), touched
@@ -0,0 +1,215 @@
+import bisect
+import json
+
+# ====================================
+# コレクションの検索
+# ====================================
+# 「持っている協力ゲームで Weight 2.5 以下、5人で遊べて1年遊んでいないもの」のような
+# 条件を、全件を舐めずに答える。
+# - mechanics / categories / designers / status / type は 値 → ビットセット の転置インデックス
+# - weight / 人数 / プレイ時間 / lastplay などはソート済み配列を二分探索してビットセットにする
+# ビットセットは Python の int（ビット i が items[i]）。条件の組み合わせは & / | / ~ だけで済む。
+
+
+def _float(v):
+    if isinstance(v, dict):
+        v = v.get("value")
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _stat(key):
+    return lambda g: _float((g.get("stats") or {}).get(key))
+
+
+def _rating(key):
+    return lambda g: _float(((g.get("stats") or {}).get("rating") or {}).get(key))
+
+
+# 転置インデックスを作るフィールド → アイテムから値のリストを取り出す関数
+TERM_FIELDS = {
+    "mechanics": lambda g: g.get("mechanics") or [],
+    "categories": lambda g: g.get("categories") or [],
+    "designers": lambda g: g.get("designers") or [],
+    "status": lambda g: [g["status"]] if g.get("status") else [],
+    "type": lambda g: [g["type"]] if g.get("type") else [],
+}
+
+# ソート済み配列を作るフィールド → 値（None は値なし）
+RANGE_FIELDS = {
+    "weight": lambda g: _float(g.get("weight")),
+    "minplayers": _stat("minplayers"),
+    "maxplayers": _stat("maxplayers"),
+    "playingtime": _stat("playingtime"),
+    "rating": _rating("value"),
+    "average": _rating("average"),
+    "numplays": lambda g: _float(g.get("numplays")),
+    "yearpublished": lambda g: _float(g.get("yearpublished")),
+    "lastplay": lambda g: g.get("lastplay") or None,
+}
+
+
+def _norm(value):
+    return value.casefold()
+
+
+class CollectionQuery:
+    def __init__(self, items):
+        self.items = list(items)
+        self.all = (1 << len(self.items)) - 1
+
+        self.terms = {}
+        for field, values_of in TERM_FIELDS.items():
+            postings = {}
+            for i, g in enumerate(self.items):
+                for v in values_of(g):
+                    postings.setdefault(_norm(v), []).append(i)
+            self.terms[field] = {v: self._bits(pos) for v, pos in postings.items()}
+
+        # field → (ソート済みの値, 同じ順の位置, 値なしのビットセット)
+        self.ranges = {}
+        for field, value_of in RANGE_FIELDS.items():
+            pairs = []
+            missing = []
+            for i, g in enumerate(self.items):
+                v = value_of(g)
+                if v is None:
+                    missing.append(i)
+                else:
+                    pairs.append((v, i))
+            pairs.sort()
+            self.ranges[field] = ([v for v, _ in pairs], [i for _, i in pairs], self._bits(missing))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _bits(self, positions):
+        # 位置のリスト → ビットセット（バイト列を経由して1回で int にする）
+        buf = bytearray((len(self.items) + 7) // 8)
+        for i in positions:
+            buf[i >> 3] |= 1 << (i & 7)
+        return int.from_bytes(buf, "little")
+
+    def term(self, field, value):
+        return self.terms[field].get(_norm(value), 0)
+
+    def range(self, field, lo=None, hi=None, missing=False):
+        # lo <= 値 <= hi のビットセット。missing=True なら値なしも含める
+        values, positions, missing_bits = self.ranges[field]
+        start = 0 if lo is None else bisect.bisect_left(values, lo)
+        end = len(values) if hi is None else bisect.bisect_right(values, hi)
+        if (end - start) * 2 > len(positions):
+            # 範囲が広いときは範囲外のほうを立てて反転する
+            outside = self._bits(positions[:start]) | self._bits(positions[end:])
+            bits = self.all & ~missing_bits & ~outside
+        else:
+            bits = self._bits(positions[start:end])
+        if missing:
+            bits |= missing_bits
+        return bits
+
+    def positions(self, bits):
+        # ビットセット → 位置のリスト（昇順）
+        text = bin(bits)[:1:-1]
+        out = []
+        i = text.find("1")
+        while i != -1:
+            out.append(i)
+            i = text.find("1", i + 1)
+        return out
+
+    def select(self, f):
+        return [self.items[i] for i in self.positions(f.mask(self))]
+
+    def count(self, f):
+        return bin(f.mask(self)).count("1")
+
+    def values(self, field):
+        # 転置インデックスのキー（正規化済み）と件数
+        return {v: bin(bits).count("1") for v, bits in self.terms[field].items()}
+
+
+# ====================================
+# 条件（& / | / ~ で組み合わせる）
+# ====================================
+class Filter:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def mask(self, q):
+        return self.fn(q)
+
+    def __and__(self, other):
+        return Filter(lambda q: self.mask(q) & other.mask(q))
+
+    def __or__(self, other):
+        return Filter(lambda q: self.mask(q) | other.mask(q))
+
+    def __invert__(self):
+        return Filter(lambda q: q.all & ~self.mask(q))
+
+
+ALL = Filter(lambda q: q.all)
+
+
+def has(field, *values):
+    # values のどれかを持つ
+    def fn(q):
+        bits = 0
+        for v in values:
+            bits |= q.term(field, v)
+        return bits
+    return Filter(fn)
+
+
+def between(field, lo=None, hi=None, missing=False):
+    return Filter(lambda q: q.range(field, lo, hi, missing))
+
+
+def players(n):
+    # n 人で遊べる（minplayers <= n <= maxplayers）
+    return between("minplayers", hi=n) & between("maxplayers", lo=n)
+
+
+def not_played_since(date):
+    # date（YYYY-MM-DD）以降に遊んでいない。一度も遊んでいないものも含む
+    return ~between("lastplay", lo=date)
+
+
+def all_of(filters):
+    out = ALL
+    for f in filters:
+        out = out & f
+    return out
+
+
+# build_filter の条件のキー
+CRITERIA = [
+    "status", "type", "mechanics", "categories", "designers",
+    "min_weight", "max_weight", "players", "max_time", "not_played_since",
+]
+
+
+def build_filter(criteria):
+    # CLI / サーバーの絞り込み条件（CRITERIA をキーにした dict）から Filter を作る
+    # status / type はどれか、mechanics / categories / designers はすべてを満たすもの
+    filters = []
+    for field in ["status", "type"]:
+        if criteria.get(field):
+            filters.append(has(field, *criteria[field]))
+    for field in ["mechanics", "categories", "designers"]:
+        for v in criteria.get(field) or []:
+            filters.append(has(field, v))
+    if criteria.get("min_weight") is not None or criteria.get("max_weight") is not None:
+        filters.append(between("weight", criteria.get("min_weight"), criteria.get("max_weight")))
+    if criteria.get("players") is not None:
+        filters.append(players(criteria["players"]))
+    if criteria.get("max_time") is not None:
+        filters.append(between("playingtime", hi=criteria["max_time"]))
+    if criteria.get("not_played_since") is not None:
+        filters.append(not_played_since(criteria["not_played_since"]))
+    return all_of(filters)
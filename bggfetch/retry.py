@@ -0,0 +1,105 @@
+import collections
+import threading
+import time
+
+from . import config
+
+
+class RetryExhausted(Exception):
+    pass
+
+
+# ====================================
+# リトライ方針 + サーキットブレーカー
+# ====================================
+class RetryPolicy:
+    # 1件あたりの試行回数と、実行全体のリトライ総数に上限を持つ。
+    # 直近の結果のエラー率がしきい値を超えたらブレーカーを落とし、
+    # 残りの対象は次回に回す（reason に理由を残す）。
+
+    def __init__(
+        self,
+        max_attempts=config.THING_MAX_ATTEMPTS,
+        budget=config.THING_RETRY_BUDGET,
+        window=config.THING_BREAKER_WINDOW,
+        min_calls=config.THING_BREAKER_MIN_CALLS,
+        threshold=config.THING_BREAKER_THRESHOLD,
+    ):
+        self.max_attempts = max_attempts
+        self.budget = budget
+        self.min_calls = min_calls
+        self.threshold = threshold
+        self.retries = 0
+        self.recent = collections.deque(maxlen=window)
+        self.reason = None
+        self.last_error = None
+
+    @property
+    def tripped(self):
+        return self.reason is not None
+
+    def trip(self, reason):
+        if self.reason is None:
+            self.reason = reason
+            print(f"Circuit breaker tripped: {reason}")
+
+    def wait(self, attempt, status, retry_after=None):
+        # attempt 回目が status で失敗したあとの待ち。リトライできなければ RetryExhausted
+        if attempt >= self.max_attempts:
+            raise RetryExhausted(f"HTTP {status} after {attempt} attempts")
+        if self.retries >= self.budget:
+            self.trip(f"retry budget exhausted ({self.budget} retries)")
+            raise RetryExhausted(f"HTTP {status}, retry budget exhausted")
+        self.retries += 1
+
+        if status == 429:
+            delay = retry_after if retry_after is not None else config.SLEEP_ON_429
+        else:
+            delay = config.THING_BACKOFF_202 * 2 ** (attempt - 1)
+        time.sleep(min(delay, config.THING_BACKOFF_MAX))
+
+    def record(self, ok, error=None):
+        # ブレーカーは失敗したときだけ判定する（成功で落ちることはない）
+        self.recent.append(ok)
+        if ok:
+            return
+        self.last_error = error
+        if len(self.recent) < self.min_calls:
+            return
+        rate = self.recent.count(False) / len(self.recent)
+        if rate >= self.threshold:
+            self.trip(
+                f"error rate {rate:.0%} over last {len(self.recent)} Thing calls (last error: {self.last_error})"
+            )
+
+
+# ====================================
+# API 呼び出しの共有レート（daemon 用）
+# ====================================
+class RateBudget:
+    # トークンバケット。rate 回/秒まで、burst 回まではまとめて呼べる。
+    # 429 を受けたら penalize で全員の呼び出しを止める（レーンをまたいで共有する）
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(delay)
+
+    def penalize(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
@@ -0,0 +1,412 @@
+import datetime
+import json
+import os
+import time
+
+from . import api, config
+from .export import (
+    FragmentCache,
+    canonicalize,
+    write_collection,
+    write_index,
+    write_rows,
+    write_shards,
+    write_variants,
+)
+from .links import write_groups
+from .plays import write_plays_stats
+from .retry import RetryPolicy
+from .schedule import fingerprint, plan_targets
+from .search import write_names_index
+from .seed import SeedDump, seed_games
+from .snapshot import Snapshot, write_snapshot
+from .stats import write_facets
+
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+# run --only で選べるフェーズ
+PHASES = ["collection", "thing", "plays"]
+
+
+def today_jst():
+    return datetime.datetime.now(JST).date()
+
+
+# ====================================
+# 前回の状態
+# ====================================
+def read_export():
+    try:
+        with open(config.OUTPUT_PATH, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return b"[]"
+
+
+def load_state():
+    # fragment_cache: 前回出力のアイテム単位のバイト列
+    # old_dict: objectid → 前回の THING_KEYS / lastplay を持つ dict
+    # schedule: objectid → Thing 取得のスケジュール情報
+    #   （fetched: 最終取得日, deferred: 見送り理由, failures: 続けて失敗した回数, retry_after: 次に試す日）
+    # meta: 実行全体の状態
+    # export_bytes: 前回の bgg_collection.json（stored_games で必要になったときだけパースする）
+    old_bytes = read_export()
+
+    snapshot = Snapshot.open(config.SNAPSHOT_PATH, old_bytes)
+    state = {
+        "schedule": snapshot.schedule() if snapshot else {},
+        "meta": snapshot.meta() if snapshot else {},
+        "export_bytes": old_bytes,
+    }
+    if snapshot is not None and snapshot.matches:
+        # スナップショットが今の bgg_collection.json と一致すれば JSON はパースしない
+        print("Warm start from snapshot")
+        state["fragment_cache"] = FragmentCache.from_spans(old_bytes, snapshot.spans())
+        state["old_dict"] = snapshot.state(config.THING_KEYS)
+        return state
+
+    old_data = json.loads(old_bytes)
+    state["stored_items"] = old_data
+    state["fragment_cache"] = FragmentCache.from_export(old_bytes, old_data)
+    # パースしたアイテムをそのまま引く（merge_collection は THING_KEYS と lastplay しか読まない）
+    state["old_dict"] = {g["objectid"]: g for g in old_data}
+    return state
+
+
+def stored_games(state):
+    # 保存済みの bgg_collection.json のアイテム（objectid → dict）
+    # collection を全件取り直して Thing も取らない実行では使わないので、必要になってからパースする
+    # （スナップショットが一致しなかったときは load_state でパースした結果を使う）
+    if "stored_items" not in state:
+        state["stored_items"] = json.loads(state["export_bytes"])
+    return {g["objectid"]: g for g in state["stored_items"]}
+
+
+# ====================================
+# 各フェーズ
+# ====================================
+def merge_collection(all_games, old_dict, is_monthly_refresh):
+    new_dict = {g["objectid"]: g for g in all_games}
+
+    for oid, g in new_dict.items():
+        if oid in old_dict:
+            for key in config.THING_KEYS:
+                if key in old_dict[oid]:
+                    g[key] = old_dict[oid][key]
+
+        if not is_monthly_refresh and oid in old_dict and "lastplay" in old_dict[oid]:
+            g["lastplay"] = old_dict[oid]["lastplay"]
+
+    return new_dict
+
+
+def collection_since(meta, today, has_items):
+    # 差分取得の起点（modifiedsince）。None なら全件取得する
+    # 初回、前回の全件取得から COLLECTION_FULL_SYNC_DAYS 日たったときは全件
+    synced = meta.get("collection_synced")
+    full = meta.get("collection_full")
+    if not has_items or not synced or not full:
+        return None
+    if (today - datetime.date.fromisoformat(full)).days >= config.COLLECTION_FULL_SYNC_DAYS:
+        return None
+    since = datetime.date.fromisoformat(synced) - datetime.timedelta(days=config.COLLECTION_SYNC_OVERLAP_DAYS)
+    return since.isoformat()
+
+
+def merge_delta(stored, changed):
+    # 差分取得の結果を保存済みのアイテムに重ねる（差分にないアイテムはそのまま）
+    # merge_collection が書き換えるので保存済みのアイテムはコピーする
+    games = {oid: dict(g) for oid, g in stored.items()}
+    for g in changed:
+        games[g["objectid"]] = g
+    return list(games.values())
+
+
+def thing_targets(games, ids, today, schedule, skip=(), limit=None):
+    # games: objectid → アイテム。ids 指定があればそれだけ、なければ plan_targets
+    if ids:
+        to_update = [games[oid] for oid in ids if oid in games and oid not in skip]
+        target_info = [f"{g['name']['value']} (requested)" for g in to_update]
+        return to_update, target_info
+
+    to_update, target_info = plan_targets(
+        (g for g in games.values() if g["objectid"] not in skip), today, schedule, limit
+    )
+    return to_update, target_info
+
+
+def update_things(to_update, schedule, today, policy=None):
+    # 戻り値は取得できた objectid のリスト
+    # 失敗したもの、ブレーカーが落ちて取得しなかったものは schedule に理由を残して次回に回す
+    policy = policy or RetryPolicy()
+    updated = []
+    for game in to_update:
+        oid = game["objectid"]
+        entry = schedule.setdefault(oid, {})
+        if policy.tripped:
+            entry["deferred"] = policy.reason
+            continue
+        try:
+            game.update(api.fetch_thing_info(oid, policy))
+            entry["fetched"] = today.isoformat()
+            entry["fp"] = fingerprint(game)
+            for key in ["deferred", "failures", "retry_after"]:
+                entry.pop(key, None)
+            updated.append(oid)
+            policy.record(True)
+            time.sleep(config.SLEEP_BETWEEN_CALLS)
+        except Exception as e:
+            print(f"Thing error {oid} {e}")
+            entry["deferred"] = str(e)
+            # 失敗が続くものは次に試すまでの間隔を倍にしていく（ブレーカーで見送ったものは数えない）
+            entry["failures"] = entry.get("failures", 0) + 1
+            days = min(2 ** (entry["failures"] - 1), config.THING_FAILURE_BACKOFF_MAX_DAYS)
+            entry["retry_after"] = (today + datetime.timedelta(days=days)).isoformat()
+            policy.record(False, e)
+    return updated
+
+
+def apply_plays(new_dict, lastplays, full_refresh):
+    if full_refresh:
+        for g in new_dict.values():
+            g.pop("lastplay", None)
+
+    for oid, date in lastplays.items():
+        if oid in new_dict:
+            new_dict[oid]["lastplay"] = date
+
+
+def export_all(games, state):
+    if config.CANONICAL_OUTPUT:
+        final_list = canonicalize(games)
+    else:
+        final_list = sorted(games, key=lambda x: x["name"]["value"].lower())
+
+    cache = state["fragment_cache"]
+    write_stats = write_collection(config.OUTPUT_PATH, final_list, cache)
+    output_sizes = {config.OUTPUT_PATH: write_stats["bytes"]}
+    output_sizes.update(write_variants(config.OUTPUT_DIR, final_list))
+    output_sizes[config.ROWS_PATH] = write_rows(config.ROWS_PATH, final_list)
+    output_sizes[config.INDEX_PATH] = write_index(config.OUTPUT_PATH, config.INDEX_PATH, final_list, write_stats)
+    output_sizes[config.GROUPS_PATH] = write_groups(config.GROUPS_PATH, final_list)
+    output_sizes[config.STATS_PATH], stats_rows = write_facets(
+        config.STATS_PATH, config.STATS_STATE_PATH, final_list, write_stats["hashes"]
+    )
+    output_sizes[config.NAMES_INDEX_PATH] = write_names_index(config.NAMES_INDEX_PATH, final_list)
+    shard_stats = write_shards(config.SHARD_DIR, final_list, cache)
+    output_sizes[config.SHARD_DIR] = shard_stats["bytes"]
+    write_snapshot(
+        config.SNAPSHOT_PATH, final_list, write_stats, config.THING_KEYS, state["schedule"], state["meta"]
+    )
+
+    return {
+        "final_list": final_list,
+        "write_stats": write_stats,
+        "output_sizes": output_sizes,
+        "shard_stats": shard_stats,
+        "stats_rows": stats_rows,
+    }
+
+
+def print_export_summary(result):
+    write_stats = result["write_stats"]
+    print(f"{len(result['final_list'])} games saved")
+    print(f"Items changed: {write_stats['encoded']} (unchanged: {write_stats['reused']})")
+    print(f"Bytes changed: {write_stats['changed_bytes']} / {write_stats['bytes']}")
+    print(f"Bytes removed: {write_stats['removed_bytes']}")
+    for path, size in result["output_sizes"].items():
+        print(f"{path}: {size} bytes")
+    print(f"Shards changed: {result['shard_stats']['changed']} / {result['shard_stats']['shards']}")
+    print(f"Stats rows updated: {result['stats_rows']}")
+
+
+def print_seeded(counts):
+    filled, complete, baselines = counts
+    if filled or baselines:
+        print(f"Seeded from dump: {filled} (complete: {complete}, stats baselines: {baselines})")
+
+
+# ====================================
+# run（毎日の更新 / --only で一部のフェーズだけ）
+# ====================================
+def run(username=config.USERNAME, today=None, only=None, ids=None, seed=None, thing_limit=None):
+    # only: PHASES の部分集合。None なら全フェーズ（毎日の更新）
+    # seed: Thing 情報を先に埋めるローカルのダンプのパス（bggfetch.seed）
+    # thing_limit: 今回の Thing 取得の上限（既定: THING_MAX_PER_RUN）
+    # collection を取らないときは保存済みの bgg_collection.json を土台にして
+    # 取得したフィールドだけを差し替える
+    from .notify import send_email
+
+    # JST基準で今日の日付を取得
+    today = today or today_jst()
+    phases = set(only or PHASES)
+    # プレイ記録の全件取り直しは毎月1日の通常実行だけ
+    is_monthly_refresh = only is None and today.day == 1
+    # プレイ記録の集計（bgg_plays.json）の元がまだなければ全ページ取る
+    plays_full = is_monthly_refresh or not os.path.exists(config.PLAYS_STATE_PATH)
+    timings = {}
+    # API の呼び出し回数はこの実行の分だけを数える（daemon や single_flight の追加実行では前回分が残っている）
+    api.COLLECTION_CALLS = 0
+    api.PLAYS_CALLS = 0
+    # フェーズごとの取得開始時刻（実行中に来た依頼をこの結果で済ませられるかの判定用）
+    phase_started = {}
+
+    if only is not None:
+        print(f"Phases: {', '.join(p for p in PHASES if p in phases)}")
+    if "plays" in phases:
+        if is_monthly_refresh:
+            print("Plays sync mode: FULL REFRESH")
+        elif plays_full:
+            print("Plays sync mode: FULL (no play history)")
+        else:
+            print("Plays sync mode: INCREMENTAL")
+
+    t = time.perf_counter()
+    state = load_state()
+    timings["state"] = time.perf_counter() - t
+
+    # collection は最初に投げておき、BGG の 202（エクスポート作成待ち）の間に
+    # plays と Thing を進める
+    collection_future = None
+    played_future = None
+    since = None
+    if "collection" in phases:
+        since = collection_since(state["meta"], today, bool(state["old_dict"]))
+        print(f"Collection sync mode: {'CHANGES SINCE ' + since if since else 'FULL'}")
+        phase_started["collection"] = time.time()
+        collection_future = api.start_collections([username], modifiedsince=since)[username]
+
+    # collection が届くまでは保存済みの bgg_collection.json を土台にする
+    # （collection を取らない・Thing を先に取る・差分取得で重ねる場合だけ）
+    if "collection" not in phases or "thing" in phases or since is not None:
+        new_dict = stored_games(state)
+    else:
+        new_dict = {}
+
+    lastplays = None
+    play_records = None
+    if "plays" in phases:
+        print("Fetching plays...")
+        t = time.perf_counter()
+        phase_started["plays"] = time.time()
+        play_records = api.fetch_plays(username, full_refresh=plays_full)
+        lastplays = api.latest_plays(play_records)
+        timings["plays"] = time.perf_counter() - t
+        if since is not None:
+            # プレイ記録の追加では collection の変更日時が動かないので、
+            # 最近遊んだアイテムは numplays を取り直す
+            played = sorted(oid for oid, date in lastplays.items() if date >= since and oid in state["old_dict"])
+            if played:
+                played_future = api.start_collections([username], ids=played)[username]
+
+    updated = []
+    target_info = []
+    # サマリーに追記する行
+    notes = []
+    dumps = [SeedDump(path) for path in seed or []]
+    if "thing" in phases:
+        policy = RetryPolicy()
+        if dumps:
+            print_seeded(seed_games(new_dict, dumps, state["schedule"]))
+        thing_limit = config.THING_MAX_PER_RUN if thing_limit is None else thing_limit
+        to_update, target_info = thing_targets(new_dict, ids, today, state["schedule"], limit=thing_limit)
+        print(f"Thing targets: {len(to_update)}")
+
+        t = time.perf_counter()
+        phase_started["thing"] = time.time()
+        updated = update_things(to_update, state["schedule"], today, policy)
+        attempted = {g["objectid"] for g in to_update}
+        timings["thing"] = time.perf_counter() - t
+
+    # 取得に失敗したフェーズ（run の戻り値の errors、終了コードに使う）
+    errors = []
+    if collection_future is not None:
+        t = time.perf_counter()
+        stored = new_dict
+        try:
+            all_games = collection_future.result()
+            played_games = played_future.result() if played_future is not None else []
+        except Exception as e:
+            # plays / Thing はもう取得済みなので捨てずに、保存済みのアイテムに反映して書き出す
+            print(f"Collection error: {e}")
+            notes.append(f"Collection failed: {e}")
+            errors.append("collection")
+            phase_started.pop("collection", None)
+            collection_future = None
+            new_dict = stored or stored_games(state)
+        timings["collection wait"] = time.perf_counter() - t
+
+    if collection_future is not None:
+        t = time.perf_counter()
+        if since is not None:
+            print(f"Collection changes: {len(all_games)}")
+            all_games = merge_delta(stored, all_games + played_games)
+        else:
+            removed = set(state["old_dict"]) - {g["objectid"] for g in all_games}
+            if removed:
+                print(f"Removed from collection: {len(removed)}")
+            state["meta"]["collection_full"] = today.isoformat()
+        state["meta"]["collection_synced"] = today.isoformat()
+        new_dict = merge_collection(all_games, state["old_dict"], is_monthly_refresh)
+        timings["collection wait"] += time.perf_counter() - t
+
+        # 先に取得した Thing 情報を反映する
+        for oid in updated:
+            if oid in new_dict:
+                new_dict[oid].update({k: stored[oid][k] for k in config.THING_KEYS if k in stored[oid]})
+
+        if "thing" in phases:
+            if dumps:
+                print_seeded(seed_games(new_dict, dumps, state["schedule"]))
+            # collection で増えたアイテムや統計が動いたアイテムなど、保存済みデータでは決められなかった対象
+            more, more_info = thing_targets(
+                new_dict, ids, today, state["schedule"], skip=attempted,
+                limit=thing_limit - len(attempted),
+            )
+            if more:
+                print(f"Thing targets (after collection): {len(more)}")
+                t = time.perf_counter()
+                updated += update_things(more, state["schedule"], today, policy)
+                timings["thing"] += time.perf_counter() - t
+                to_update += more
+                target_info += more_info
+
+    if "thing" in phases:
+        for oid in ids or []:
+            if oid not in new_dict:
+                print(f"Not in collection: {oid}")
+        if policy.tripped:
+            deferred = sum(1 for g in to_update if g["objectid"] not in updated)
+            notes.append(f"Thing deferred: {deferred} ({policy.reason})")
+        notes.append(f"Thing retries: {policy.retries} / {policy.budget}")
+
+    if lastplays is not None:
+        apply_plays(new_dict, lastplays, is_monthly_refresh)
+
+    t = time.perf_counter()
+    result = export_all(new_dict.values(), state)
+    if play_records is not None:
+        result["output_sizes"][config.PLAYS_STATS_PATH], months = write_plays_stats(
+            config.PLAYS_STATS_PATH, config.PLAYS_STATE_PATH, play_records, plays_full
+        )
+        notes.append(f"Play months updated: {months}")
+    timings["export"] = time.perf_counter() - t
+
+    print_export_summary(result)
+    print(f"Thing updated: {len(updated)}")
+    print(f"Collection API calls: {api.COLLECTION_CALLS}")
+    print(f"Plays API calls: {api.PLAYS_CALLS}")
+    for line in notes:
+        print(line)
+    print("Phase timings: " + ", ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+
+    # 手動の部分更新ではメールを送らない
+    if only is None:
+        send_email(
+            len(updated), len(result["final_list"]), target_info, is_monthly_refresh,
+            result["write_stats"], result["output_sizes"], notes,
+        )
+    result["phase_started"] = phase_started
+    result["errors"] = errors
+    result["thing_ids"] = updated
+    return result
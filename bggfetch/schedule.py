@@ -0,0 +1,113 @@
+import datetime
+
+from . import config
+
+# ====================================
+# Thing 取得のスケジュール
+# ====================================
+# collection（stats=1）に入っている usersrated / average / numowned を
+# 前回 Thing を取得したときの値（fingerprint）と比べ、動いたものだけを取り直す。
+# 動かないものも THING_MAX_AGE_DAYS で一度は取り直す。
+# まだ取得日の記録がないもの（移行前のデータ）は従来どおりローテーションで回す。
+# 取得に失敗したもの（failures）は retry_after の日まで対象にせず、その後も
+# ほかの対象の後ろに回す（失敗し続けるものでブレーカーが毎回落ちないように）。
+
+
+def _num(v):
+    if isinstance(v, dict):
+        v = v.get("value")
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def fingerprint(g):
+    stats = g.get("stats") or {}
+    rating = stats.get("rating") or {}
+    return (_num(rating.get("usersrated")), _num(rating.get("average")), _num(stats.get("numowned")))
+
+
+def drift_score(old, new):
+    # 1 以上でしきい値超え
+    base = config.FINGERPRINT_MIN_BASE
+    users = abs(new[0] - old[0]) / max(old[0], base) / config.FINGERPRINT_COUNT_DRIFT
+    average = abs(new[1] - old[1]) / config.FINGERPRINT_AVERAGE_DRIFT
+    owned = abs(new[2] - old[2]) / max(old[2], base) / config.FINGERPRINT_COUNT_DRIFT
+    return max(users, average, owned)
+
+
+def plan_targets(games, today, schedule=None, limit=None):
+    # Thing 情報がないものは全部。それ以外は
+    # 前回見送り → fingerprint のずれが大きい順 → 取得から古い順 → 後から足した項目の穴埋め → ローテーション
+    # → 失敗が続いているもの の順に limit 件まで
+    # 失敗が続いている Thing 情報がないものは、ほかの対象をすべて並べた後に回す
+    schedule = {} if schedule is None else schedule
+    limit = config.THING_MAX_PER_RUN if limit is None else limit
+    today_mod = today.toordinal() % config.ROTATION_DAYS
+    missing = []
+    missing_failed = []
+    deferred = []
+    failed = []
+    waiting = 0
+    drifted = []
+    aged = []
+    backfill = []
+    rotation = []
+
+    for g in games:
+        oid = g["objectid"]
+        name = g["name"]["value"]
+        entry = schedule.setdefault(oid, {})
+        failures = entry.get("failures", 0)
+        if failures and entry.get("retry_after", "") > today.isoformat():
+            waiting += 1
+            continue
+
+        if any(k not in g for k in config.THING_REQUIRED_KEYS):
+            if failures:
+                missing_failed.append((g, f"{name} (missing thing data, failed {failures}x)"))
+            else:
+                missing.append((g, f"{name} (missing thing data)"))
+            continue
+
+        if entry.get("deferred"):
+            if failures:
+                failed.append((g, f"{name} (failed {failures}x: {entry['deferred']})"))
+            else:
+                deferred.append((g, f"{name} (deferred: {entry['deferred']})"))
+            continue
+
+        fp = fingerprint(g)
+        if "fp" not in entry:
+            # 基準値がなければ今の値を基準にする
+            entry["fp"] = fp
+        else:
+            score = drift_score(entry["fp"], fp)
+            if score >= 1:
+                drifted.append((score, g, f"{name} (stats drift x{score:.1f})"))
+                continue
+
+        if any(k not in g for k in config.THING_KEYS):
+            backfill.append((g, f"{name} (backfill)"))
+            continue
+
+        fetched = entry.get("fetched")
+        if fetched is None:
+            if int(oid) % config.ROTATION_DAYS == today_mod:
+                rotation.append((g, f"{name} (rotation bucket)"))
+            continue
+
+        age = (today - datetime.date.fromisoformat(fetched)).days
+        if age >= config.THING_MAX_AGE_DAYS:
+            aged.append((age, g, f"{name} (max age {age}d)"))
+
+    drifted.sort(key=lambda x: -x[0])
+    aged.sort(key=lambda x: -x[0])
+    queue = deferred + [x[1:] for x in drifted] + [x[1:] for x in aged] + backfill + rotation + failed
+    if waiting:
+        print(f"Thing backoff: {waiting} item(s) wait after repeated failures")
+    if len(queue) > limit:
+        print(f"Thing queue: {len(queue) - limit} item(s) wait for a later run")
+    picked = missing + queue[:max(limit, 0)] + missing_failed
+    return [g for g, _ in picked], [info for _, info in picked]
@@ -0,0 +1,109 @@
+import itertools
+import json
+import math
+import unicodedata
+
+from .export import write_if_changed
+
+# ====================================
+# ゲーム名のあいまい検索
+# ====================================
+# name.value と Thing の別名（altnames）を正規化し、2-gram / 3-gram → 名前番号 の
+# 転置インデックスを作る。検索はクエリの n-gram の posting だけを数えるので全件は舐めない。
+# 検索は 3-gram で行い、2文字以下のクエリ（日本語の短い名前など）だけ 2-gram を使う。
+# スコアは n-gram 集合の Dice 係数に、部分文字列として含まれる場合の加点を足したもの。
+# 候補は posting の短い（珍しい）n-gram から集める: need 個以上一致する名前は、
+# 短い順に len(クエリ) - need + 1 個の n-gram のどれかを必ず含む。
+
+NAMES_FORMAT_VERSION = 1
+GRAM_SIZES = (2, 3)
+# クエリが名前にそのまま含まれるときの加点
+SUBSTRING_BONUS = 0.5
+# クエリの n-gram のうちこの割合以上を含む名前だけを候補にする
+MIN_GRAM_MATCH = 0.4
+
+
+def normalize(text):
+    # 全角/半角・大文字小文字をそろえ、記号は空白にする（"Catan: 5-6 Player" → "catan 5 6 player"）
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(c if c.isalnum() else " " for c in text)
+    return " ".join(text.split())
+
+
+def grams(norm, n):
+    padded = f" {norm} "
+    out = {padded[i:i + n] for i in range(len(padded) - n + 1)}
+    out.discard("  ")
+    return out
+
+
+def query_gram_size(norm):
+    return 3 if len(norm) >= 3 else 2
+
+
+def build_names_index(items):
+    # names: [objectid, 名前, 正規化した名前, 2-gram 数, 3-gram 数]、grams: n-gram → 名前番号のリスト
+    names = []
+    postings = {}
+    for g in items:
+        oid = g["objectid"]
+        seen = set()
+        for name in [g["name"]["value"]] + list(g.get("altnames") or []):
+            norm = normalize(name)
+            if not norm or norm in seen:
+                continue
+            seen.add(norm)
+            idx = len(names)
+            names.append([oid, name, norm])
+            for n in GRAM_SIZES:
+                gs = grams(norm, n)
+                names[idx].append(len(gs))
+                for gram in gs:
+                    postings.setdefault(gram, []).append(idx)
+    return {"version": NAMES_FORMAT_VERSION, "names": names, "grams": dict(sorted(postings.items()))}
+
+
+def write_names_index(path, items):
+    doc = build_names_index(items)
+    data = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    write_if_changed(path, data)
+    return len(data)
+
+
+class NameIndex:
+    def __init__(self, doc):
+        if doc.get("version") != NAMES_FORMAT_VERSION:
+            raise ValueError(f"Unsupported names index version: {doc.get('version')}")
+        self.names = doc["names"]
+        self.grams = doc["grams"]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def search(self, text, limit=10):
+        # 戻り値: [(score, objectid, 一致した名前)]。objectid ごとに一番よい名前だけ
+        norm = normalize(text)
+        if not norm:
+            return []
+        n = query_gram_size(norm)
+        qgrams = grams(norm, n)
+        need = max(1, math.ceil(len(qgrams) * MIN_GRAM_MATCH))
+        rare = sorted(qgrams, key=lambda gram: len(self.grams.get(gram, ())))[:len(qgrams) - need + 1]
+        candidates = set(itertools.chain.from_iterable(self.grams.get(gram, ()) for gram in rare))
+
+        size_col = 3 + GRAM_SIZES.index(n)
+        best = {}
+        for idx in candidates:
+            entry = self.names[idx]
+            oid, name, name_norm = entry[:3]
+            common = len(qgrams & grams(name_norm, n))
+            if common < need:
+                continue
+            score = 2 * common / (len(qgrams) + entry[size_col])
+            if norm in name_norm:
+                score += SUBSTRING_BONUS
+            if oid not in best or score > best[oid][0]:
+                best[oid] = (score, oid, name)
+        return sorted(best.values(), key=lambda r: (-r[0], r[2]))[:limit]
@@ -0,0 +1,224 @@
+import csv
+import datetime
+import json
+import os
+import re
+
+from . import config
+from .schedule import fingerprint
+
+# ====================================
+# ローカルのダンプから Thing 情報を埋める
+# ====================================
+# 新しく入れた環境やユーザーでは全アイテムが missing thing data になり、
+# thing API を1件ずつ叩くことになる。手元にあるダンプで埋められる分は先に埋める。
+# 対応する形式:
+#   - BGG が公開しているランキング CSV（boardgames_ranks.csv）
+#     id, name, yearpublished, rank, bayesaverage, average, usersrated, is_expansion, ...
+#     THING_KEYS のうち type と、collection の統計（usersrated / average / bayesaverage / rank）が分かる
+#     （デザイナー等は入っていないので Thing は API で取る）
+#   - 以前の bgg_collection.json（別の環境やユーザーのもの）
+#     THING_KEYS と統計をそのまま使う
+# 統計は stats.rating の欠けている項目を埋め、schedule の fingerprint の基準値
+# （まだないものだけ）にもダンプの時点の値を使う。ダンプより後に統計が動いたものは drift で取り直される。
+# ファイルは最初に引いたときに1回だけ頭から読み、objectid → バイト位置 の索引だけを作る
+# （ランキング CSV は十数万行あるので、行やアイテムそのものは持たない）。
+# 引かれたものだけその位置から読み直してアイテムの形にする。
+
+OBJECTID_RE = re.compile(rb'    "objectid": "(\d+)",?\n')
+# bgg_collection.json（indent=2）のトップレベルのアイテムの始まりと終わりの行
+ITEM_OPEN = b"  {\n"
+ITEM_CLOSE = (b"  }\n", b"  },\n")
+# stats.rating のうちダンプから埋める項目
+RATING_KEYS = ["usersrated", "average", "bayesaverage", "ranks"]
+
+
+def _read_csv_row(f):
+    # 1レコード分（引用符の中の改行をまたぐ）を読んでパースする。ファイルの終わりなら None
+    line = f.readline()
+    if not line:
+        return None
+    while line.count(b'"') % 2:
+        more = f.readline()
+        if not more:
+            break
+        line += more
+    return next(csv.reader([line.decode("utf-8-sig")]), [])
+
+
+class SeedDump:
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        # ダンプの日付（ファイルの更新日）を取得日として扱う
+        mtime = os.path.getmtime(path)
+        self.date = datetime.datetime.fromtimestamp(mtime, datetime.timezone.utc).date()
+        self._index = None
+        self._columns = None
+        # 索引を作れない書式の JSON だけは全体をパースしたものを持つ
+        self._loaded = None
+        # 引いたアイテム（同じ実行で seed_games が2回呼ばれる）
+        self._items = {}
+
+    def _build_csv(self):
+        index = {}
+        with open(self.path, "rb") as f:
+            header = _read_csv_row(f) or []
+            self._columns = {name: i for i, name in enumerate(header)}
+            if "id" not in self._columns:
+                raise ValueError(f"{self.name}: no 'id' column")
+            id_col = self._columns["id"]
+            while True:
+                pos = f.tell()
+                row = _read_csv_row(f)
+                if row is None:
+                    break
+                if len(row) > id_col:
+                    index[row[id_col]] = pos
+        return index
+
+    def _csv_item(self, row):
+        # CSV の行を bgg_collection.json のアイテムと同じ形にする
+        def cell(name):
+            i = self._columns.get(name)
+            return row[i] if i is not None and i < len(row) and row[i] != "" else None
+
+        item = {}
+        expansion = cell("is_expansion")
+        if expansion is not None:
+            item["type"] = "boardgameexpansion" if expansion == "1" else "boardgame"
+        rating = {key: {"value": cell(key)} for key in ["usersrated", "average", "bayesaverage"] if cell(key)}
+        rank = cell("rank")
+        if rank is not None:
+            rating["ranks"] = {"rank": {
+                "type": "subtype", "id": "1", "name": "boardgame", "friendlyname": "Board Game Rank",
+                "value": rank if rank != "0" else "Not Ranked", "bayesaverage": cell("bayesaverage") or "0",
+            }}
+        if rating:
+            item["stats"] = {"rating": rating}
+        return item
+
+    def _build_json(self):
+        # bgg_collection.json の書式なら1行ずつ読んでアイテムの始まりの位置だけを覚える
+        index = {}
+        with open(self.path, "rb") as f:
+            if f.readline() == b"[\n":
+                start = None
+                while True:
+                    pos = f.tell()
+                    line = f.readline()
+                    if not line:
+                        break
+                    if line == ITEM_OPEN:
+                        start = pos
+                        continue
+                    m = OBJECTID_RE.fullmatch(line) if start is not None else None
+                    if m:
+                        index[m.group(1).decode("ascii")] = start
+                        start = None
+                if index:
+                    return index
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if data.strip() in (b"[]", b""):
+            return {}
+        # bgg_collection.json と違う書式なら全体をパースする
+        self._loaded = [g for g in json.loads(data) if isinstance(g, dict)]
+        return {str(g.get("objectid")): i for i, g in enumerate(self._loaded)}
+
+    def _read_json_item(self, pos):
+        with open(self.path, "rb") as f:
+            f.seek(pos)
+            lines = []
+            for line in f:
+                if line in ITEM_CLOSE:
+                    lines.append(b"  }")
+                    break
+                lines.append(line)
+        return json.loads(b"".join(lines))
+
+    @property
+    def index(self):
+        if self._index is None:
+            if self.path.lower().endswith(".csv"):
+                self._index = self._build_csv()
+            else:
+                self._index = self._build_json()
+            print(f"Seed {self.name}: {len(self._index)} item(s) indexed")
+        return self._index
+
+    def item(self, oid):
+        # ダンプにあるアイテム（CSV はアイテムの形にしたもの）。なければ None
+        pos = self.index.get(oid)
+        if pos is None:
+            return None
+        if oid not in self._items:
+            if self._loaded is not None:
+                self._items[oid] = self._loaded[pos]
+            elif self._columns is not None:
+                with open(self.path, "rb") as f:
+                    f.seek(pos)
+                    self._items[oid] = self._csv_item(_read_csv_row(f))
+            else:
+                self._items[oid] = self._read_json_item(pos)
+        return self._items[oid]
+
+
+def _rating(g):
+    return (g.get("stats") or {}).get("rating") or {}
+
+
+def baseline(g, item):
+    # ダンプの時点の fingerprint。ダンプにない値（CSV の numowned など）は今の値を使う
+    then = fingerprint(item)
+    now = fingerprint(g)
+    rating = _rating(item)
+    present = ("usersrated" in rating, "average" in rating, "numowned" in (item.get("stats") or {}))
+    return tuple(t if p else n for t, n, p in zip(then, now, present))
+
+
+def seed_games(games, dumps, schedule):
+    # games: objectid → アイテム。THING_KEYS と stats.rating の欠けている項目だけを埋める（既存の値は上書きしない）
+    # THING_REQUIRED_KEYS がそろったものは schedule にダンプの日付を取得日として記録し、今日の取得対象から外す
+    # fingerprint の基準値がまだないものはダンプの時点の値にする
+    # 戻り値: (何か埋めた件数, そろった件数, 基準値を入れた件数)
+    filled = 0
+    complete = 0
+    baselines = 0
+    for oid, g in games.items():
+        entry = schedule.get(oid) or {}
+        rating_gaps = [k for k in RATING_KEYS if k not in _rating(g)]
+        if all(k in g for k in config.THING_KEYS) and not rating_gaps and "fp" in entry:
+            continue
+        had_required = all(k in g for k in config.THING_REQUIRED_KEYS)
+        touched = False
+        for dump in dumps:
+            item = dump.item(oid)
+            if not item:
+                continue
+            for k in config.THING_KEYS:
+                if k in item and k not in g:
+                    g[k] = item[k]
+                    touched = True
+            dump_rating = _rating(item)
+            for k in [k for k in rating_gaps if k in dump_rating]:
+                g.setdefault("stats", {}).setdefault("rating", {})[k] = dump_rating[k]
+                rating_gaps.remove(k)
+                touched = True
+            if "fp" not in entry and "stats" in item:
+                entry = schedule.setdefault(oid, {})
+                entry["fp"] = baseline(g, item)
+                baselines += 1
+            if not had_required and all(k in g for k in config.THING_REQUIRED_KEYS):
+                entry = schedule.setdefault(oid, {})
+                entry["fetched"] = dump.date.isoformat()
+                entry["seeded"] = dump.name
+                for key in ["deferred", "failures", "retry_after"]:
+                    entry.pop(key, None)
+                complete += 1
+                had_required = True
+            if all(k in g for k in config.THING_KEYS) and not rating_gaps:
+                break
+        if touched:
+            filled += 1
+    return filled, complete, baselines
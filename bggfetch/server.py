@@ -0,0 +1,242 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import config
+from .plays import with_dust
+from .query import CRITERIA, CollectionQuery, build_filter
+from .runner import today_jst
+from .search import NameIndex, build_names_index
+
+# ====================================
+# 読み取り専用の HTTP サーバー
+# ====================================
+# 保存済みの bgg_collection.json をメモリに載せて返す（外部サービス不要）。
+#   GET /collection?status=owned&mechanics=...&offset=0&limit=50&fields=objectid,name
+#   GET /collection/<objectid>
+#   GET /search?q=...&limit=10
+#   GET /rows   （bgg_rows.json そのまま）
+#   GET /plays  （bgg_plays.json に今日の時点のほこり日数などを足したもの）
+# ETag はデータの sha256 とパス・クエリから決まるので、データが変わらなければ
+# If-None-Match で 304 を返す（本文は作らない）。
+# bgg_collection.json が書き換わったら（run の後など）次のリクエストで読み直す。
+
+# クエリパラメータ → build_filter の条件（複数値はカンマ区切りか同じキーの繰り返し）
+LIST_PARAMS = {"status", "type", "mechanics", "categories", "designers"}
+NUMBER_PARAMS = {"min_weight", "max_weight", "players", "max_time"}
+
+
+class Store:
+    # ある時点のデータ一式（差し替えは Store ごと）
+    def __init__(self, data, stat_key):
+        self.stat_key = stat_key
+        # ETag の元（派生ファイルの更新も反映されるように stat も混ぜる）
+        self.sha256 = hashlib.sha256(data + repr(stat_key[1:]).encode("ascii")).hexdigest()
+        items = json.loads(data)
+        self.query = CollectionQuery(items)
+        self.by_id = {g["objectid"]: g for g in items}
+        try:
+            self.names = NameIndex.load(config.NAMES_INDEX_PATH)
+        except (FileNotFoundError, ValueError):
+            self.names = NameIndex(build_names_index(items))
+        try:
+            with open(config.ROWS_PATH, "rb") as f:
+                self.rows = f.read()
+        except FileNotFoundError:
+            self.rows = None
+        try:
+            with open(config.PLAYS_STATS_PATH, "r", encoding="utf-8") as f:
+                self.plays = json.load(f)
+        except FileNotFoundError:
+            self.plays = None
+
+
+def _stat_key(path):
+    # 派生ファイルは bgg_collection.json の後に書かれるので、それも見る
+    key = []
+    for p in [path, config.ROWS_PATH, config.NAMES_INDEX_PATH, config.PLAYS_STATS_PATH]:
+        try:
+            st = os.stat(p)
+            key.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            key.append(None)
+    return tuple(key)
+
+
+class StoreHolder:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.checked = 0.0
+        self.store = self._load()
+
+    def _load(self):
+        key = _stat_key(self.path)
+        with open(self.path, "rb") as f:
+            data = f.read()
+        store = Store(data, key)
+        print(f"Loaded {len(store.by_id)} games ({store.sha256[:12]})")
+        return store
+
+    def get(self):
+        # SERVE_RELOAD_INTERVAL 秒に1回だけ stat して、変わっていれば読み直す
+        now = time.monotonic()
+        if now - self.checked >= config.SERVE_RELOAD_INTERVAL:
+            with self.lock:
+                if now - self.checked >= config.SERVE_RELOAD_INTERVAL:
+                    self.checked = now
+                    try:
+                        if _stat_key(self.path) != self.store.stat_key:
+                            self.store = self._load()
+                    except (OSError, ValueError) as e:
+                        # 書き換えの途中などは前のデータのまま返す
+                        print(f"Reload failed: {e}")
+        return self.store
+
+
+def _criteria(params, today):
+    criteria = {}
+    for key in CRITERIA:
+        values = [v for raw in params.get(key, []) for v in raw.split(",") if v]
+        if not values:
+            continue
+        if key in LIST_PARAMS:
+            criteria[key] = values
+        elif key in NUMBER_PARAMS:
+            criteria[key] = float(values[0])
+        else:
+            criteria[key] = values[0]
+    if "not_played_days" in params:
+        days = int(params["not_played_days"][0])
+        criteria["not_played_since"] = (today - datetime.timedelta(days=days)).isoformat()
+    return criteria
+
+
+def _project(g, fields):
+    if not fields:
+        return g
+    return {k: g[k] for k in fields if k in g}
+
+
+def _int_param(params, key, default, maximum=None):
+    value = int(params.get(key, [default])[0])
+    if value < 0:
+        raise ValueError(f"{key} must be >= 0")
+    return min(value, maximum) if maximum is not None else value
+
+
+class Handler(BaseHTTPRequestHandler):
+    holder = None
+    server_version = "bggfetch"
+
+    def log_message(self, format, *args):
+        if config.SERVE_ACCESS_LOG:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        store = self.holder.get()
+
+        route = self._route(url.path, store)
+        if route is None:
+            self._send_json(404, {"error": "not found"})
+            return
+
+        # 同じデータ・同じ日付（not_played_days 用）・同じパスとクエリなら同じ本文になる
+        today = today_jst()
+        canonical = url.path + "?" + urllib.parse.urlencode(sorted(params.items()), doseq=True)
+        etag = '"' + hashlib.sha1(f"{store.sha256}|{today}|{canonical}".encode("utf-8")).hexdigest() + '"'
+        if self._matches(etag):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        try:
+            body = route(params, today)
+        except (KeyError, ValueError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        if body is None:
+            self._send_json(404, {"error": "not found"})
+            return
+        if not isinstance(body, bytes):
+            body = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self._send(200, body, etag)
+
+    def _route(self, path, store):
+        parts = [p for p in path.split("/") if p]
+        if parts == ["collection"]:
+            return lambda params, today: self._collection(store, params, today)
+        if len(parts) == 2 and parts[0] == "collection":
+            return lambda params, today: self._item(store, parts[1], params)
+        if parts == ["search"]:
+            return lambda params, today: self._search(store, params)
+        if parts == ["rows"]:
+            return lambda params, today: store.rows
+        if parts == ["plays"]:
+            return lambda params, today: with_dust(store.plays, today) if store.plays else None
+        return None
+
+    def _collection(self, store, params, today):
+        f = build_filter(_criteria(params, today))
+        positions = store.query.positions(f.mask(store.query))
+        offset = _int_param(params, "offset", 0)
+        limit = _int_param(params, "limit", config.SERVE_PAGE_SIZE, config.SERVE_MAX_PAGE_SIZE)
+        fields = params["fields"][0].split(",") if "fields" in params else None
+        page = [_project(store.query.items[i], fields) for i in positions[offset:offset + limit]]
+        return {"total": len(positions), "offset": offset, "limit": limit, "items": page}
+
+    def _item(self, store, oid, params):
+        if oid not in store.by_id:
+            return None
+        fields = params["fields"][0].split(",") if "fields" in params else None
+        return _project(store.by_id[oid], fields)
+
+    def _search(self, store, params):
+        text = params.get("q", [""])[0]
+        limit = _int_param(params, "limit", 10, config.SERVE_MAX_PAGE_SIZE)
+        results = store.names.search(text, limit)
+        return [{"score": round(score, 3), "objectid": oid, "name": name} for score, oid, name in results]
+
+    def _matches(self, etag):
+        header = self.headers.get("If-None-Match")
+        if not header:
+            return False
+        tags = [t.strip() for t in header.split(",")]
+        return "*" in tags or etag in tags
+
+    def _send(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, doc):
+        self._send(status, json.dumps(doc, ensure_ascii=False).encode("utf-8"))
+
+
+def make_server(host, port, path=None):
+    handler = type("BoundHandler", (Handler,), {"holder": StoreHolder(path or config.OUTPUT_PATH)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve(host=None, port=None, path=None):
+    httpd = make_server(host or config.SERVE_HOST, port or config.SERVE_PORT, path)
+    print(f"Serving on http://{httpd.server_address[0]}:{httpd.server_address[1]}/")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
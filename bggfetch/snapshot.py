@@ -0,0 +1,98 @@
+import hashlib
+import marshal
+import os
+import struct
+import zlib
+
+# ====================================
+# 前回実行の状態スナップショット（バイナリ）
+# ====================================
+# bgg_collection.json を json.load しなくても次の実行を始められるように、
+# objectid ごとに必要な状態だけを保存する:
+#   (item_hash, offset, length, thing fields, lastplay, schedule)
+# schedule は Thing 取得のスケジュール用の dict（fetched: 最終取得日, deferred: 見送った理由, failures / retry_after: 失敗の回数と次に試す日 など）。
+# 実行全体の状態は meta に持つ。
+# ヘッダに書き出し時の bgg_collection.json のサイズと sha256 を持ち、
+# 一致しないとき（手で編集された等）は schedule / meta だけを使い、残りは JSON から読み直す。
+# 本体が読めないとき（途中で切れた・別の Python の marshal 等）はスナップショットなしとして扱う。
+
+SNAPSHOT_MAGIC = b"BGGSNAP\0"
+SNAPSHOT_VERSION = 2
+_HEADER = struct.Struct(">8sHQ32s")  # magic, version, export size, export sha256
+
+
+class Snapshot:
+    def __init__(self, path, matches, payload):
+        self.path = path
+        # 今の bgg_collection.json と一致するか（False なら spans / state は使えない）
+        self.matches = matches
+        self.payload = payload
+
+    @classmethod
+    def open(cls, path, export_bytes):
+        # 読めない・形式が違うときは None（呼び出し側は JSON から読み直す）
+        try:
+            with open(path, "rb") as f:
+                header = f.read(_HEADER.size)
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        if len(header) != _HEADER.size:
+            return None
+        magic, version, size, digest = _HEADER.unpack(header)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            return None
+        try:
+            payload = marshal.loads(zlib.decompress(body))
+        except (zlib.error, ValueError, EOFError, TypeError) as e:
+            print(f"Ignoring unreadable snapshot: {e}")
+            return None
+        if not isinstance(payload, dict) or not isinstance(payload.get("items"), dict):
+            print("Ignoring unreadable snapshot: unexpected payload")
+            return None
+        matches = size == len(export_bytes) and digest == hashlib.sha256(export_bytes).digest()
+        return cls(path, matches, payload)
+
+    @property
+    def items(self):
+        return self.payload["items"]
+
+    def meta(self):
+        return dict(self.payload["meta"])
+
+    def spans(self):
+        # FragmentCache.from_spans 用：item_hash → (offset, length)
+        return {rec[0]: (rec[1], rec[2]) for rec in self.items.values()}
+
+    def state(self, thing_keys):
+        # 前回の THING_KEYS と lastplay（old_dict と同じ形）
+        out = {}
+        for oid, rec in self.items.items():
+            g = {k: rec[3][k] for k in thing_keys if k in rec[3]}
+            if rec[4] is not None:
+                g["lastplay"] = rec[4]
+            out[oid] = g
+        return out
+
+    def schedule(self):
+        return {oid: dict(rec[5]) for oid, rec in self.items.items() if rec[5]}
+
+
+def write_snapshot(path, items, write_stats, thing_keys, schedule, meta):
+    # items / write_stats は write_collection に渡したもの・返ってきたもの
+    records = {}
+    for g, key, (offset, length) in zip(items, write_stats["hashes"], write_stats["offsets"]):
+        oid = g["objectid"]
+        thing = {k: g[k] for k in thing_keys if k in g}
+        records[oid] = (key, offset, length, thing, g.get("lastplay"), schedule.get(oid) or {})
+
+    header = _HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_VERSION, write_stats["bytes"], bytes.fromhex(write_stats["sha256"])
+    )
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(zlib.compress(marshal.dumps({"items": records, "meta": meta}), 6))
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
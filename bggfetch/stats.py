@@ -0,0 +1,205 @@
+import collections
+import json
+import marshal
+import math
+import os
+
+from .export import _rank, _value, write_if_changed
+
+# ====================================
+# コレクションの集計（ファセット / 分布）
+# ====================================
+# アイテムごとに集計用の行（ROW_COLUMNS の列）を作り、列ごとの Counter に足し込む。
+# 行とアイテムのハッシュは state に残し、次回はハッシュが変わったアイテム
+# （write_collection の hashes で分かる）と消えたアイテムの行だけを引いて足し直す。
+# 集計はすべて足し引きできる形（件数・合計）で持つので全件を舐め直さなくてよい。
+
+STATS_FORMAT_VERSION = 1
+STATS_STATE_VERSION = 1
+
+# 集計の列。値はアイテムから作る関数（リストの列は要素ごとに数える）
+ROW_COLUMNS = ["status", "type", "mechanics", "designers", "categories", "weight", "rating", "average", "rank"]
+# 合計を持つ列（平均は合計 / 件数で出す）
+SUM_COLUMNS = ["playingtime", "numplays"]
+
+RANK_BUCKETS = [(1, 100), (101, 500), (501, 1000), (1001, 5000), (5001, None)]
+UNRATED = "unrated"
+
+
+def _number(v):
+    try:
+        x = float(_value(v))
+    except (TypeError, ValueError):
+        return None
+    return x if math.isfinite(x) else None
+
+
+def _weight_bucket(g):
+    # 0.5 刻み（"2.0-2.5"）。投票なし（0）は unrated
+    w = _number(g.get("weight"))
+    if not w:
+        return UNRATED
+    lo = math.floor(w * 2) / 2
+    return f"{lo:.1f}-{lo + 0.5:.1f}"
+
+
+def _score_bucket(v):
+    # 1 刻み（"7"）。10 点は "10"
+    x = _number(v)
+    if not x:
+        return UNRATED
+    return str(min(int(x), 10))
+
+
+def _rank_bucket(g):
+    rating = (g.get("stats") or {}).get("rating") or {}
+    rank = _rank((rating.get("ranks") or {}).get("rank"), "boardgame")
+    if not rank.isdigit():
+        return "unranked"
+    n = int(rank)
+    for lo, hi in RANK_BUCKETS:
+        if hi is None or n <= hi:
+            return f"{lo}+" if hi is None else f"{lo}-{hi}"
+    return "unranked"
+
+
+def item_row(g):
+    # 戻り値: (ROW_COLUMNS の値..., SUM_COLUMNS の値...)。None は数えない
+    stats = g.get("stats") or {}
+    rating = stats.get("rating") or {}
+    return (
+        g.get("status"),
+        g.get("type"),
+        tuple(g.get("mechanics") or ()),
+        tuple(g.get("designers") or ()),
+        tuple(g.get("categories") or ()),
+        _weight_bucket(g),
+        _score_bucket(rating.get("value")),
+        _score_bucket(rating.get("average")),
+        _rank_bucket(g),
+        _number(stats.get("playingtime")),
+        _number(g.get("numplays")),
+    )
+
+
+def empty_aggregate():
+    agg = {column: collections.Counter() for column in ROW_COLUMNS}
+    for column in SUM_COLUMNS:
+        agg[column] = [0.0, 0]
+    agg["items"] = 0
+    return agg
+
+
+def apply_row(agg, row, sign):
+    # sign: +1 で足す、-1 で引く
+    agg["items"] += sign
+    for column, value in zip(ROW_COLUMNS, row):
+        values = value if isinstance(value, tuple) else (value,)
+        counter = agg[column]
+        for v in values:
+            if v is None:
+                continue
+            counter[v] += sign
+            if not counter[v]:
+                del counter[v]
+    for column, value in zip(SUM_COLUMNS, row[len(ROW_COLUMNS):]):
+        if value is not None:
+            agg[column][0] += sign * value
+            agg[column][1] += sign
+
+
+def load_state(path):
+    try:
+        with open(path, "rb") as f:
+            state = marshal.load(f)
+    except (FileNotFoundError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(state, dict) or state.get("version") != STATS_STATE_VERSION:
+        return None
+    agg = state["agg"]
+    for column in ROW_COLUMNS:
+        agg[column] = collections.Counter(agg[column])
+    return state
+
+
+def save_state(path, state):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    agg = dict(state["agg"])
+    for column in ROW_COLUMNS:
+        agg[column] = dict(agg[column])
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        marshal.dump({"version": STATS_STATE_VERSION, "rows": state["rows"], "agg": agg}, f)
+    os.replace(tmp_path, path)
+
+
+def update_stats(state, items, hashes):
+    # state: load_state の結果（None なら全件から作る）
+    # items / hashes: write_collection に渡したアイテムと返ってきた hashes（同じ並び）
+    # 戻り値: (新しい state, 行を作り直した件数)
+    if state is None:
+        state = {"rows": {}, "agg": empty_aggregate()}
+    rows = state["rows"]
+    agg = state["agg"]
+    current = {}
+    touched = 0
+    for g, key in zip(items, hashes):
+        oid = g["objectid"]
+        current[oid] = key
+        old = rows.get(oid)
+        if old is not None and old[0] == key:
+            continue
+        if old is not None:
+            apply_row(agg, old[1], -1)
+        row = item_row(g)
+        apply_row(agg, row, +1)
+        rows[oid] = (key, row)
+        touched += 1
+    for oid in [oid for oid in rows if oid not in current]:
+        apply_row(agg, rows.pop(oid)[1], -1)
+        touched += 1
+    return state, touched
+
+
+def _facet(counter):
+    # 件数の多い順、同数は名前順
+    return [[k, n] for k, n in sorted(counter.items(), key=lambda kv: (-kv[1], kv[0]))]
+
+
+def _histogram(counter, order=None):
+    keys = sorted(counter, key=order) if order else sorted(counter)
+    return {k: counter[k] for k in keys}
+
+
+def _bucket_order(key):
+    # "unrated" / "unranked" は末尾、それ以外は先頭の数値順
+    head = key.split("-")[0].rstrip("+")
+    return (0, float(head)) if head.replace(".", "", 1).isdigit() else (1, 0.0)
+
+
+def build_stats(agg):
+    doc = {"version": STATS_FORMAT_VERSION, "items": agg["items"]}
+    for column in ["status", "type"]:
+        doc[column] = _histogram(agg[column])
+    for column in ["mechanics", "designers", "categories"]:
+        doc[column] = _facet(agg[column])
+    for column in ["weight", "rating", "average", "rank"]:
+        doc[column] = _histogram(agg[column], _bucket_order)
+    for column in SUM_COLUMNS:
+        total, count = agg[column]
+        doc[column] = {
+            "total": round(total, 2),
+            "count": count,
+            "mean": round(total / count, 2) if count else None,
+        }
+    return doc
+
+
+def write_facets(path, state_path, items, hashes):
+    # 戻り値: (バイト数, 行を作り直した件数)
+    state, touched = update_stats(load_state(state_path), items, hashes)
+    data = json.dumps(build_stats(state["agg"]), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    write_if_changed(path, data)
+    if touched:
+        save_state(state_path, state)
+    return len(data), touched
@@ -0,0 +1,141 @@
+# ====================================
+# Thing の XML（<item>）の読み取り
+# ====================================
+# <item> の子要素を1回だけ走査し、タグごとに登録したハンドラに振り分ける。
+# 取り出す項目を増やすときは LINK_FIELDS / POLL_FIELDS / HANDLERS に足すだけでよく、
+# 走査は増えない。
+
+# link の type → 出力のキー（値は value のリスト）
+LINK_FIELDS = {
+    "boardgamedesigner": "designers",
+    "boardgamemechanic": "mechanics",
+    "boardgamecategory": "categories",
+    "boardgamepublisher": "publishers",
+    "boardgameartist": "artists",
+    "boardgamefamily": "families",
+}
+# boardgameexpansion の link は objectid のリストにする
+# inbound="true" はこの拡張の本体、それ以外はこのゲームの拡張
+EXPANSION_FIELDS = {False: "expansions", True: "expands"}
+
+# 単純な <tag value="..."/> → 出力のキー
+VALUE_FIELDS = {
+    "minage": "minage",
+    "minplayers": "minplayers",
+    "maxplayers": "maxplayers",
+    "playingtime": "playingtime",
+}
+
+# 最多得票の選択肢だけを残す poll → 出力のキー
+POLL_FIELDS = {
+    "language_dependence": "languagedependence",
+    "suggested_playerage": "playerage",
+}
+
+HANDLERS = {}
+
+
+def handler(tag):
+    def register(fn):
+        HANDLERS[tag] = fn
+        return fn
+    return register
+
+
+def _votes(result):
+    try:
+        return int(result.get("numvotes", 0))
+    except ValueError:
+        return 0
+
+
+@handler("link")
+def _link(el, out):
+    link_type = el.get("type")
+    if link_type == "boardgameexpansion":
+        out[EXPANSION_FIELDS[el.get("inbound") == "true"]].append(el.get("id"))
+        return
+    field = LINK_FIELDS.get(link_type)
+    if field:
+        out[field].append(el.get("value"))
+
+
+@handler("name")
+def _name(el, out):
+    # primary は collection の name と同じなので alternate だけ
+    if el.get("type") == "alternate":
+        out["altnames"].append(el.get("value"))
+
+
+@handler("poll")
+def _poll(el, out):
+    name = el.get("name")
+    if name == "suggested_numplayers":
+        _numplayers_poll(el, out)
+        return
+    field = POLL_FIELDS.get(name)
+    if field is None:
+        return
+    best = None
+    for result in el.iter("result"):
+        votes = _votes(result)
+        if votes and (best is None or votes > best[0]):
+            best = (votes, result.get("level") or result.get("value"))
+    if best is not None:
+        out[field] = best[1]
+
+
+def _numplayers_poll(el, out):
+    # 人数ごとの Best / Recommended / Not Recommended の得票から
+    # bestplayers: Best が最多の人数、recplayers: Best + Recommended が Not Recommended を上回る人数
+    for results in el.findall("results"):
+        votes = {r.get("value"): _votes(r) for r in results.findall("result")}
+        best = votes.get("Best", 0)
+        rec = votes.get("Recommended", 0)
+        not_rec = votes.get("Not Recommended", 0)
+        count = results.get("numplayers")
+        if best + rec > not_rec:
+            out["recplayers"].append(count)
+        if best and best >= rec and best >= not_rec:
+            out["bestplayers"].append(count)
+
+
+@handler("statistics")
+def _statistics(el, out):
+    ratings = el.find("ratings")
+    if ratings is None:
+        return
+    for child in ratings:
+        if child.tag == "averageweight":
+            out["weight"] = child.get("value")
+        elif child.tag == "ranks":
+            out["ranks"] = {r.get("name"): r.get("value") for r in child.findall("rank")}
+
+
+def _value_handler(field):
+    def handle(el, out):
+        out[field] = el.get("value")
+    return handle
+
+
+for _tag, _field in VALUE_FIELDS.items():
+    HANDLERS[_tag] = _value_handler(_field)
+
+
+def parse_thing(item):
+    # item: Thing API の <item> 要素。戻り値は取り出せた項目すべての dict
+    out = {field: [] for field in LINK_FIELDS.values()}
+    for field in EXPANSION_FIELDS.values():
+        out[field] = []
+    out["altnames"] = []
+    out["bestplayers"] = []
+    out["recplayers"] = []
+    out["weight"] = None
+    out["minage"] = None
+    out["type"] = item.get("type", "boardgame")
+
+    for el in item:
+        handle = HANDLERS.get(el.tag)
+        if handle is not None:
+            handle(el, out)
+    return out
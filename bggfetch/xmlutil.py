@@ -0,0 +1,22 @@
+# ====================================
+# XML → dict
+# ====================================
+def xml_to_dict(element):
+    d = {}
+    if element.attrib:
+        d.update(element.attrib)
+    children = list(element)
+    if children:
+        for child in children:
+            child_dict = xml_to_dict(child)
+            if child.tag in d:
+                if not isinstance(d[child.tag], list):
+                    d[child.tag] = [d[child.tag]]
+                d[child.tag].append(child_dict)
+            else:
+                d[child.tag] = child_dict
+    else:
+        text = element.text.strip() if element.text else None
+        if text:
+            d["value"] = text
+    return d
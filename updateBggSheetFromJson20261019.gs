@@ -0,0 +1,149 @@
+/**
+ * D1のチェックボックスが操作された時に実行されるトリガー
+ */
+function onEditTrigger(e) {
+  if (!e || !e.range) return;
+  const sheet = e.range.getSheet();
+  
+  if (sheet.getName() !== 'bgg-collection') return;
+
+  // A1: スプレッドシートの表示更新のみ
+  if (e.range.getA1Notation() === "A1" && e.value === "TRUE") {
+    e.range.setValue(false);
+    updateBggSheetFromJson();
+  }
+
+  // D1: プレイ記録だけを取り直す（全体の更新は毎日の定期実行に任せる）
+  if (e.range.getA1Notation() === "D1" && e.value === "TRUE") {
+    e.range.setValue(false);
+    
+    const success = triggerGitHubAction("plays");
+    
+    if (success) {
+      SpreadsheetApp.getActiveSpreadsheet().toast("GitHub Actionsを起動しました。更新完了までしばらくお待ちください。", "実行成功", 5);
+    } else {
+      SpreadsheetApp.getActiveSpreadsheet().toast("GitHub APIの呼び出しに失敗しました。", "エラー", 5);
+    }
+  }
+}
+
+/**
+ * GitHub Actions (Repository Dispatch) を実行する
+ * only: 実行するフェーズ（"plays" など。省略すると全フェーズ）
+ */
+function triggerGitHubAction(only) {
+  const props = PropertiesService.getScriptProperties();
+  const GITHUB_TOKEN = props.getProperty('GITHUB_TOKEN');
+  
+  if (!GITHUB_TOKEN) {
+    SpreadsheetApp.getActiveSpreadsheet().toast("スクリプトプロパティ 'GITHUB_TOKEN' が設定されていません。", "エラー", 5);
+    return false;
+  }
+  const url = `https://api.github.com/repos/zkbdg/bgg-owned-fetch/dispatches`;
+
+  const payload = {
+    "event_type": "run"
+  };
+  if (only) {
+    payload["client_payload"] = { "only": only };
+  }
+
+  const options = {
+    "method": "post",
+    "headers": {
+      "Accept": "application/vnd.github+json",
+      "Authorization": "Bearer " + GITHUB_TOKEN
+    },
+    "payload": JSON.stringify(payload),
+    "muteHttpExceptions": true
+  };
+
+  try {
+    const response = UrlFetchApp.fetch(url, options);
+    return (response.getResponseCode() === 204);
+  } catch (e) {
+    console.error(e);
+    return false;
+  }
+}
+
+/**
+ * メイン関数：BGGからデータを取得してシートを再構築する
+ */
+function updateBggSheetFromJson() {
+  // ★整形・並び替え済みの行データ（Python側で生成）を読む
+  const ROWS_URL = 'https://raw.githubusercontent.com/zkbdg/bgg-owned-fetch/main/output/bgg_rows.json';
+  const ss = SpreadsheetApp.getActiveSpreadsheet();
+  let sheet = ss.getSheetByName('bgg-collection') || ss.insertSheet('bgg-collection');
+
+  // --- 1. 初期化 ---
+  if (sheet.getFilter()) { sheet.getFilter().remove(); }
+  sheet.clear(); 
+  sheet.clearConditionalFormatRules();
+
+  // A1: 表示更新用
+  const checkboxValidation = SpreadsheetApp.newDataValidation().requireCheckbox().build();
+  sheet.getRange("A1").setDataValidation(checkboxValidation).setValue(false);
+  sheet.getRange("B1").setValue("←表示を最新に更新").setFontSize(9).setFontColor("#666666");
+
+  // D1: GitHub連携用
+  sheet.getRange("D1").setDataValidation(checkboxValidation).setValue(false);
+  sheet.getRange("E1").setValue("←プレイ記録を更新").setFontSize(9).setFontColor("#d32f2f").setFontWeight("bold");
+
+  // --- 2. データ取得 ---
+  // extractValue / formatNum / getRank / 並び替えは fetch 側で済んでいる
+  const response = UrlFetchApp.fetch(ROWS_URL);
+  const rowsDoc = JSON.parse(response.getContentText());
+  const headers = rowsDoc.headers;
+  const finalRows = rowsDoc.rows;
+
+  sheet.getRange(2, 1, 1, headers.length).setValues([headers]);
+  
+  if (finalRows.length > 0) {
+    const totalRows = finalRows.length;
+    const dataRange = sheet.getRange(3, 1, totalRows, headers.length);
+    dataRange.setValues(finalRows);
+
+    const richTexts = finalRows.map(row => [
+      SpreadsheetApp.newRichTextValue().setText(row[0]).setLinkUrl(`https://boardgamegeek.com/boardgame/${row[19]}`).build()
+    ]);
+    sheet.getRange(3, 1, totalRows, 1).setRichTextValues(richTexts);
+
+    sheet.getRange(3, 4, totalRows, 3).setNumberFormat("0.00");
+    sheet.getRange(3, 7, totalRows, 2).setNumberFormat("0");
+    sheet.getRange(3, 9, totalRows, 1).setNumberFormat("0.00");
+    sheet.getRange(3, 10, totalRows, 5).setNumberFormat("0");
+
+    const bgColors = finalRows.map(row => {
+      const status = row[18];
+      let color = "#ffffff";
+      if (status === "preordered") color = "#e6ffed";
+      else if (status === "wishlist") color = "#fff3e0";
+      else if (status === "previouslyowned") color = "#f5f5f5";
+      else if (status === "played(not owned)") color = "#e3f2fd";
+      return Array(headers.length).fill(color);
+    });
+    dataRange.setBackgrounds(bgColors);
+
+    const rules = [];
+    const ratingRange = sheet.getRange(3, 4, totalRows, 3);
+    const rankRange = sheet.getRange(3, 7, totalRows, 2);
+    const weightRange = sheet.getRange(3, 9, totalRows, 1);
+    rules.push(SpreadsheetApp.newConditionalFormatRule().whenNumberBetween(1, 100).setFontColor("#ff0000").setBold(true).setRanges([rankRange]).build());
+    rules.push(SpreadsheetApp.newConditionalFormatRule().whenNumberLessThan(3.0).setFontColor("#2e7d32").setBold(true).setRanges([weightRange]).build());
+    rules.push(SpreadsheetApp.newConditionalFormatRule().whenNumberBetween(3.0, 4.0).setFontColor("#ef6c00").setBold(true).setRanges([weightRange]).build());
+    rules.push(SpreadsheetApp.newConditionalFormatRule().whenNumberGreaterThanOrEqualTo(4.0).setFontColor("#c62828").setBold(true).setRanges([weightRange]).build());
+    const ratingColors = [{min: 9, bg: "#1b5e20"}, {min: 8, bg: "#4caf50"}, {min: 7, bg: "#2196f3"}, {min: 5, bg: "#9575cd"}, {min: 0.1, bg: "#f44336"}];
+    ratingColors.forEach(c => {
+      rules.push(SpreadsheetApp.newConditionalFormatRule().whenNumberBetween(c.min, 10).setBackground(c.bg).setFontColor("#ffffff").setRanges([ratingRange]).build());
+    });
+    sheet.setConditionalFormatRules(rules);
+    sheet.getRange(2, 1, totalRows + 1, headers.length).createFilter();
+  }
+
+  sheet.setFrozenRows(2);
+  sheet.setFrozenColumns(1);
+  const widths = [250, 60, 100, 60, 70, 100, 120, 120, 80, 80, 80, 90, 60, 60, 150, 250, 200, 100, 100, 60];
+  widths.forEach((w, i) => sheet.setColumnWidth(i + 1, w));
+  sheet.getRange(2, 1, 1, headers.length).setFontWeight("bold").setBackground("#f3f3f3").setHorizontalAlignment("center");
+}